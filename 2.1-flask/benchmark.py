@@ -0,0 +1,125 @@
+import argparse
+import time
+
+from flask import request
+from sqlalchemy import event, update, delete
+
+from models import Session, engine, User, Sticker
+from server import app, auth, check_password, pool_metrics
+
+
+def use_eager_session():
+    # поведение до ленивой сессии: Session() на каждый запрос, закрытие только в after_request,
+    # и проверка пароля с запросом в БД даже без заголовка Authorization (пустое имя)
+    @auth.verify_password
+    def verify_password(username, password):
+        user = request.session.query(User).filter(User.name == username).first()
+        if not user or not check_password(user.password, password):
+            request.user_id = None
+            return False
+        request.user_id = user.id
+        return True
+
+    @app.before_request
+    def before_request():
+        request.session = Session()
+
+    @app.after_request
+    def after_request(response):
+        request.session.close()
+        return response
+
+
+def bench_checkouts(requests_count: int, sticker_id: int):
+    """
+    Выдачи соединений из пула на requests_count запросов: GET из кэша, PATCH без авторизации, /metrics.
+    Соединение берется только при первом запросе к БД, поэтому GET из кэша и /metrics его не берут в обоих режимах,
+    разница - в PATCH без авторизации
+    """
+    client = app.test_client()
+    urls = [('get', f'/sticker/{sticker_id}/'), ('patch', f'/sticker/{sticker_id}/'), ('get', '/metrics')]
+    checkouts = pool_metrics.checkouts
+    start = time.perf_counter()
+    for number in range(requests_count):
+        method, url = urls[number % len(urls)]
+        getattr(client, method)(url, json={})
+    duration = time.perf_counter() - start
+    checkouts = pool_metrics.checkouts - checkouts
+    print(f'requests={requests_count} checkouts={checkouts} '
+          f'checkouts_per_10k={checkouts * 10000 / requests_count:.0f} '
+          f'rps={requests_count / duration:.0f} '
+          f'checked_out_after={pool_metrics.stats(engine.pool).get("checked_out")}')
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.on_execute)
+
+    def on_execute(self, *args):
+        self.count += 1
+
+
+def patch_delete_orm(session, sticker_id, owner_id):
+    # прежний путь: get -> проверка владельца в Python -> setattr -> commit
+    sticker = session.get(Sticker, sticker_id)
+    assert sticker.owner_id == owner_id
+    sticker.title = f'title{sticker.version}'
+    session.commit()
+    sticker = session.get(Sticker, sticker_id)
+    assert sticker.owner_id == owner_id
+    session.delete(sticker)
+    session.commit()
+
+
+def patch_delete_conditional(session, sticker_id, owner_id):
+    query = (update(Sticker).where(Sticker.id == sticker_id, Sticker.owner_id == owner_id)
+             .values(title='title', version=Sticker.version + 1).returning(Sticker))
+    assert session.scalars(query).one_or_none() is not None
+    session.commit()
+    query = delete(Sticker).where(Sticker.id == sticker_id, Sticker.owner_id == owner_id).returning(Sticker.id)
+    assert session.scalars(query).one_or_none() is not None
+    session.commit()
+
+
+def bench_round_trips(count: int):
+    """
+    Число SQL-запросов и время на PATCH + DELETE одного объявления: ORM-путь против условных UPDATE/DELETE.
+    Для локального запуска без PostgreSQL: DB_DSN=sqlite:///benchmark.db
+    """
+    counter = StatementCounter()
+    with Session() as session:
+        owner = User(name=f'bench_{time.time_ns()}', password='-')
+        session.add(owner)
+        session.commit()
+        owner_id = owner.id
+        for mode in (patch_delete_orm, patch_delete_conditional):
+            stickers = [Sticker(title='title', description='description', owner_id=owner_id) for _ in range(count)]
+            session.add_all(stickers)
+            session.commit()
+            sticker_ids = [sticker.id for sticker in stickers]
+            session.expunge_all()
+            statements = counter.count
+            start = time.perf_counter()
+            for sticker_id in sticker_ids:
+                mode(session, sticker_id, owner_id)
+            duration = time.perf_counter() - start
+            print(f'{mode.__name__}: statements_per_object={(counter.count - statements) / count:.1f} '
+                  f'ms_per_object={duration * 1000 / count:.2f}')
+        session.delete(session.get(User, owner_id))
+        session.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--sticker-id', type=int, default=1)
+    parser.add_argument('--eager', action='store_true', help='создавать сессию в before_request, как раньше')
+    parser.add_argument('--round-trips', type=int, default=0, help='сравнить PATCH/DELETE на N объявлениях')
+    args = parser.parse_args()
+    if args.round_trips:
+        bench_round_trips(args.round_trips)
+    else:
+        if args.eager:
+            use_eager_session()
+        bench_checkouts(args.requests, args.sticker_id)
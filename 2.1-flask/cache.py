@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class ObjectCache:
+    """
+    Кэш сериализованных объектов: (model, id) -> (ETag, JSON bytes).
+    generation() берется до чтения из БД и передается в set(): если между ними был delete(), прочитанные данные
+    могут быть старше изменения и в кэш не записываются
+    """
+
+    def get(self, model: str, object_id: int) -> Optional[Tuple[str, bytes]]:
+        return None
+
+    def generation(self, model: str, object_id: int):
+        return None
+
+    def set(self, model: str, object_id: int, etag: str, value: bytes, generation=None):
+        pass
+
+    def delete(self, model: str, object_id: int):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryObjectCache(ObjectCache):
+    """
+    LRU-кэш в памяти процесса с ограничением размера и временем жизни записей
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        # ключ -> номер последнего delete(); старые номера вытесняются, _pruned - наибольший вытесненный
+        self._counter = 0
+        self._invalidated = OrderedDict()
+        self._pruned = 0
+        self._lock = threading.Lock()
+
+    def get(self, model: str, object_id: int) -> Optional[Tuple[str, bytes]]:
+        key = (model, object_id)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            etag, value, expire_at = item
+            if expire_at <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return etag, value
+
+    def generation(self, model: str, object_id: int) -> int:
+        with self._lock:
+            return self._counter
+
+    def set(self, model: str, object_id: int, etag: str, value: bytes, generation: int = None):
+        if self.max_size <= 0:
+            return
+        key = (model, object_id)
+        with self._lock:
+            # для вытесненных ключей неизвестно, когда был delete() - запись пропускается, если могла быть после чтения
+            if generation is not None and self._invalidated.get(key, self._pruned) > generation:
+                return
+            self._items[key] = (etag, value, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def delete(self, model: str, object_id: int):
+        key = (model, object_id)
+        with self._lock:
+            self._items.pop(key, None)
+            self._counter += 1
+            self._invalidated[key] = self._counter
+            self._invalidated.move_to_end(key)
+            while len(self._invalidated) > max(self.max_size, 1):
+                self._pruned = max(self._pruned, self._invalidated.popitem(last=False)[1])
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._counter += 1
+            self._invalidated.clear()
+            self._pruned = self._counter
+
+
+class RedisObjectCache(ObjectCache):
+    """
+    Кэш в Redis, общий для всех процессов. Вытеснение - maxmemory-policy allkeys-lru на сервере, TTL - на ключе.
+    Вместо клиента redis можно передать fakeredis.FakeRedis()
+    """
+
+    def __init__(self, client=None, url: str = 'redis://localhost:6379/0', ttl: float = 60, prefix: str = 'obj'):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, model: str, object_id: int) -> str:
+        return f'{self.prefix}:{model}:{object_id}'
+
+    def _generation_key(self, model: str, object_id: int) -> str:
+        return f'{self.prefix}:gen:{model}:{object_id}'
+
+    def get(self, model: str, object_id: int) -> Optional[Tuple[str, bytes]]:
+        item = self.client.get(self._key(model, object_id))
+        if item is None:
+            return None
+        etag, value = item.split(b'\n', 1)
+        return etag.decode(), value
+
+    def generation(self, model: str, object_id: int) -> bytes:
+        return self.client.get(self._generation_key(model, object_id)) or b'0'
+
+    def set(self, model: str, object_id: int, etag: str, value: bytes, generation: bytes = None):
+        key, item = self._key(model, object_id), etag.encode() + b'\n' + value
+        if generation is None:
+            self.client.set(key, item, px=int(self.ttl * 1000))
+            return
+        from redis.exceptions import WatchError
+        # compare-and-set: WATCH на счетчик поколений, запись только если delete() не было после чтения
+        generation_key = self._generation_key(model, object_id)
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(generation_key)
+                if (pipe.get(generation_key) or b'0') != generation:
+                    return
+                pipe.multi()
+                pipe.set(key, item, px=int(self.ttl * 1000))
+                pipe.execute()
+            except WatchError:
+                pass
+
+    def delete(self, model: str, object_id: int):
+        # счетчик живет не меньше записи: после его истечения устаревшая запись тоже успела бы истечь
+        generation_key = self._generation_key(model, object_id)
+        with self.client.pipeline() as pipe:
+            pipe.delete(self._key(model, object_id))
+            pipe.incr(generation_key)
+            pipe.pexpire(generation_key, int(self.ttl * 1000))
+            pipe.execute()
+
+    def clear(self):
+        keys = list(self.client.scan_iter(f'{self.prefix}:*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+def create_object_cache(backend: str, max_size: int = 1024, ttl: float = 60, redis_url: str = '') -> ObjectCache:
+    if backend == 'memory':
+        return MemoryObjectCache(max_size=max_size, ttl=ttl)
+    if backend == 'redis':
+        return RedisObjectCache(url=redis_url, ttl=ttl)
+    if backend in ('', 'none'):
+        return ObjectCache()
+    raise ValueError(f'Неизвестный тип кэша: {backend}')
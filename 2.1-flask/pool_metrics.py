@@ -0,0 +1,57 @@
+import bisect
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+
+class PoolMetrics:
+    """
+    Метрики пула соединений: гистограмма ожидания выдачи соединения и число таймаутов
+    """
+
+    buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histogram = [0] * (len(self.buckets) + 1)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_sum = 0.0
+
+    def observe(self, wait: float):
+        with self._lock:
+            self.histogram[bisect.bisect_left(self.buckets, wait)] += 1
+            self.checkouts += 1
+            self.wait_sum += wait
+
+    def observe_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self, pool) -> dict:
+        with self._lock:
+            histogram = {str(bucket): count for bucket, count in zip(self.buckets, self.histogram)}
+            histogram['+Inf'] = self.histogram[-1]
+            stats = {'checkouts': self.checkouts, 'timeouts': self.timeouts, 'wait_sum': self.wait_sum,
+                     'wait_histogram': histogram}
+        if hasattr(pool, 'checkedout'):
+            stats.update({'size': pool.size(), 'checked_out': pool.checkedout(), 'checked_in': pool.checkedin(),
+                          'overflow': pool.overflow()})
+        return stats
+
+
+def metered_pool_class(pool_class, metrics: PoolMetrics):
+    class MeteredPool(pool_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                metrics.observe_timeout()
+                raise
+            metrics.observe(time.perf_counter() - start)
+            return connection
+
+    MeteredPool.__name__ = f'Metered{pool_class.__name__}'
+    return MeteredPool
@@ -38,3 +38,10 @@ class PatchSticker(CreateSticker):
     title: Optional[str] = None
     description: Optional[str] = None
     owner_id: Optional[int] = None
+
+
+class ListSticker(pydantic.BaseModel):
+    owner_id: Optional[int] = None
+    title: Optional[str] = None
+    cursor: Optional[str] = None
+    limit: Optional[int] = pydantic.Field(None, ge=1)
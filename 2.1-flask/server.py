@@ -1,19 +1,39 @@
+import base64
+import os
+from datetime import datetime
+
 import flask
-from flask import jsonify, request, Response
+from flask import jsonify, request, Response, stream_with_context
 from flask.views import MethodView
 from http import HTTPStatus
 from flask_httpauth import HTTPBasicAuth
 
 from pydantic import ValidationError
+from sqlalchemy import select, insert, update, delete, bindparam, tuple_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 from flask_bcrypt import Bcrypt
 
-from models import Session, User, Sticker
-from schema import DefaultValidateSchema, CreateUser, PatchUser, CreateSticker, PatchSticker
+from models import Session, User, Sticker, engine, pool_metrics
+from validation import get_adapter
+from schema import DefaultValidateSchema, CreateUser, PatchUser, CreateSticker, PatchSticker, ListSticker
+from cache import create_object_cache
+from serializer import ObjectSerializer, dumps
+
+OBJECT_CACHE = os.environ.get('OBJECT_CACHE', 'memory')
+OBJECT_CACHE_SIZE = int(os.environ.get('OBJECT_CACHE_SIZE', 1024))
+OBJECT_CACHE_TTL = float(os.environ.get('OBJECT_CACHE_TTL', 60))
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', 50))
+LIST_MAX_PAGE_SIZE = int(os.environ.get('LIST_MAX_PAGE_SIZE', 1000))
+LIST_YIELD_PER = int(os.environ.get('LIST_YIELD_PER', 100))
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 100))
 
 app = flask.Flask('app')
 auth = HTTPBasicAuth()
 bcrypt = Bcrypt(app)
+object_cache = create_object_cache(OBJECT_CACHE, max_size=OBJECT_CACHE_SIZE, ttl=OBJECT_CACHE_TTL,
+                                   redis_url=REDIS_URL)
 
 
 def hash_password(password: str) -> str:
@@ -40,9 +60,22 @@ def error_handler(error):
     return response
 
 
+def get_session() -> Session:
+    # сессия создается при первом обращении, запросы без работы с БД обходятся без нее
+    session = getattr(request, 'session', None)
+    if session is None:
+        session = Session()
+        request.session = session
+    return session
+
+
 @auth.verify_password
 def verify_password(username, password):
-    user = request.session.query(User).filter(User.name == username).first()
+    if not username:
+        # без заголовка Authorization Flask-HTTPAuth вызывает проверку с пустым именем - БД не нужна
+        request.user_id = None
+        return False
+    user = get_session().query(User).filter(User.name == username).first()
     if not user or not check_password(user.password, password):
         request.user_id = None
         return False
@@ -51,31 +84,73 @@ def verify_password(username, password):
     return True
 
 
-@app.before_request
-def before_request():
-    session = Session()
-    request.session = session
+@app.teardown_request
+def teardown_request(exception=None):
+    session = getattr(request, 'session', None)
+    if session is not None:
+        session.close()
+        request.session = None
 
 
-@app.after_request
-def after_request(response: Response):
-    request.session.close()
-    return response
+@app.route('/metrics')
+def metrics():
+    return jsonify({'db_pool': pool_metrics.stats(engine.pool)})
+
+
+def json_response(data, status: int = HTTPStatus.OK) -> Response:
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def make_etag(object_id: int, version: int) -> str:
+    return f'{object_id}-{version}'
+
+
+def encode_cursor(create_datetime: datetime, object_id: int) -> str:
+    return base64.urlsafe_b64encode(f'{create_datetime.isoformat()}|{object_id}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        create_datetime, object_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(create_datetime), int(object_id)
+    except ValueError:
+        raise HTTPException(HTTPStatus.BAD_REQUEST, f'Некорректный курсор {cursor}')
+
+
+def validation_error(err: ValidationError):
+    error = err.errors()[0]
+    error.pop('ctx', None)
+    if isinstance(error.get('input'), bytes):
+        # при невалидном JSON input - сырое тело запроса
+        error.pop('input')
+    return HTTPException(400, error)
 
 
 def validate(model, data):
     try:
-        return model.model_validate(data).model_dump(exclude_unset=True)
+        return get_adapter(model).validate_python(data)
+    except ValidationError as err:
+        raise validation_error(err)
+
+
+def validate_json(model, data: bytes):
+    # тело запроса проверяется без отдельного разбора JSON
+    try:
+        return get_adapter(model).validate_json(data)
     except ValidationError as err:
-        error = err.errors()[0]
-        error.pop('ctx', None)
-        raise HTTPException(400, error)
+        raise validation_error(err)
+
+
+def batch_error(index: int, error: HTTPException) -> dict:
+    return {'index': index, 'status': error.code, 'error': error.description}
 
 
 class ObjectView(MethodView):
+    serializer: ObjectSerializer = None
+
     @property
     def session(self) -> Session:
-        return request.session
+        return get_session()
 
     def object_description(self) -> str:
         return ''
@@ -83,6 +158,9 @@ class ObjectView(MethodView):
     def object_model(self):
         return None
 
+    def cache_key(self) -> str:
+        return self.object_model().__tablename__
+
     def get_object(self, object_id: int):
         model = self.object_model()
         obj = self.session.get(model, object_id)
@@ -93,8 +171,33 @@ class ObjectView(MethodView):
             raise HTTPException(HTTPStatus.NOT_FOUND, f'{desc} [id={object_id}] не найден')
         return obj
 
+    def get_object_version(self, object_id: int) -> int:
+        model = self.object_model()
+        version = self.session.scalar(select(model.version).where(model.id == object_id))
+        if version is None:
+            desc = self.object_description()
+            if not desc:
+                desc = self.__name__
+            raise HTTPException(HTTPStatus.NOT_FOUND, f'{desc} [id={object_id}] не найден')
+        return version
+
+    def check_if_match(self, obj):
+        if request.if_match and not request.if_match.contains_weak(make_etag(obj.id, obj.version)):
+            desc = self.object_description()
+            if not desc:
+                desc = self.__name__
+            raise HTTPException(HTTPStatus.PRECONDITION_FAILED, f'{desc} [id={obj.id}] был изменен')
+
+    def object_to_dict(self, instance) -> dict:
+        return self.serializer.to_dict(instance)
+
     def get_object_jsonify(self, instance):
-        return None
+        return Response(self.serializer.dumps(instance), mimetype='application/json')
+
+    def get_object_response(self, instance):
+        response = self.get_object_jsonify(instance)
+        response.set_etag(make_etag(instance.id, instance.version), weak=True)
+        return response
 
     def commit_object(self, instance):
         try:
@@ -105,14 +208,78 @@ class ObjectView(MethodView):
             if not desc:
                 desc = self.__name__
             raise HTTPException(HTTPStatus.BAD_REQUEST, f'{desc} уже существует')
+        except StaleDataError:
+            self.session.rollback()
+            desc = self.object_description()
+            if not desc:
+                desc = self.__name__
+            raise HTTPException(HTTPStatus.PRECONDITION_FAILED, f'{desc} [id={instance.id}] был изменен')
+        object_cache.delete(self.cache_key(), instance.id)
         return instance
 
-    def get(self, object_id: int):
-        obj = self.get_object(object_id)
-        return self.get_object_jsonify(obj)
+    def get_cached_object(self, object_id: int) -> tuple:
+        cached = object_cache.get(self.cache_key(), object_id)
+        if cached is None:
+            # поколение до чтения: если PATCH успеет сбросить кэш после него, старые данные не запишутся
+            generation = object_cache.generation(self.cache_key(), object_id)
+            obj = self.get_object(object_id)
+            cached = make_etag(obj.id, obj.version), self.get_object_jsonify(obj).get_data()
+            object_cache.set(self.cache_key(), object_id, *cached, generation=generation)
+        return cached
+
+    def list_query(self, params: dict, cursor: tuple = None):
+        return None
+
+    def get_list(self):
+        list_shema = self.validate_shema().get('list')
+        if list_shema is None:
+            raise HTTPException(HTTPStatus.METHOD_NOT_ALLOWED, 'Получение списка не поддерживается')
+        params = validate(list_shema, request.args.to_dict())
+        limit = min(params.get('limit', LIST_PAGE_SIZE), LIST_MAX_PAGE_SIZE)
+        cursor = decode_cursor(params['cursor']) if params.get('cursor') else None
+        query = self.list_query(params, cursor).limit(limit + 1)
+
+        def generate():
+            # строки читаются порциями по LIST_YIELD_PER, страница целиком в памяти не собирается
+            with Session() as session:
+                result = session.execute(query, execution_options={'yield_per': LIST_YIELD_PER})
+                yield b'{"items": ['
+                next_cursor = None
+                last_row = None
+                for count, row in enumerate(result):
+                    if count == limit:
+                        next_cursor = encode_cursor(last_row.create_datetime, last_row.id)
+                        break
+                    if count:
+                        yield b', '
+                    yield self.serializer.dumps(row)
+                    last_row = row
+                yield b'], "next_cursor": ' + dumps(next_cursor) + b'}'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
+
+    def get(self, object_id: int = None):
+        if object_id is None:
+            return self.get_list()
+        if request.if_none_match:
+            cached = object_cache.get(self.cache_key(), object_id)
+            if cached is not None:
+                etag = cached[0]
+            else:
+                etag = make_etag(object_id, self.get_object_version(object_id))
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=HTTPStatus.NOT_MODIFIED)
+                response.set_etag(etag, weak=True)
+                return response
+        etag, data = self.get_cached_object(object_id)
+        response = Response(data, mimetype='application/json')
+        response.set_etag(etag, weak=True)
+        return response
+
+    shemas = {'post': DefaultValidateSchema, 'patch': DefaultValidateSchema}
 
     def validate_shema(self) -> dict:
-        return {'post': DefaultValidateSchema, 'patch': DefaultValidateSchema}
+        return self.shemas
 
     def post_after_validate(self, data):
         return data
@@ -122,13 +289,13 @@ class ObjectView(MethodView):
 
     @auth.login_required
     def post(self):
-        object_data = validate(self.validate_shema()['post'], request.json)
+        object_data = validate_json(self.validate_shema()['post'], request.get_data())
         object_data = self.post_after_validate(object_data)
         model_class = self.object_model()
         new_object = model_class(**object_data)
         new_object = self.post_after_create(new_object)
         self.commit_object(new_object)
-        return self.get_object_jsonify(new_object)
+        return self.get_object_response(new_object)
 
     def patch_after_validate(self, data):
         return data
@@ -136,43 +303,217 @@ class ObjectView(MethodView):
     def before_patch(self, obj):
         return obj
 
+    def owner_column(self):
+        return None
+
+    def owned_object_filter(self, query, object_id: int):
+        model = self.object_model()
+        query = query.where(model.id == object_id)
+        owner = self.owner_column()
+        if owner is not None:
+            query = query.where(owner == request.user_id)
+        versions = self.if_match_versions(object_id)
+        if versions is not None:
+            query = query.where(model.version.in_(versions))
+        return query
+
+    @staticmethod
+    def if_match_versions(object_id: int):
+        if not request.if_match or request.if_match.star_tag:
+            return None
+        versions = []
+        for etag in request.if_match.as_set(include_weak=True):
+            etag_object_id, _, version = etag.partition('-')
+            if etag_object_id == str(object_id) and version.isdigit():
+                versions.append(int(version))
+        return versions
+
+    def raise_not_changed(self, object_id: int, check_access):
+        # условный запрос не затронул ни одной строки - выясняем причину: 404, 403 или 412
+        obj = self.get_object(object_id)
+        check_access(obj)
+        self.check_if_match(obj)
+        desc = self.object_description()
+        if not desc:
+            desc = self.__name__
+        raise HTTPException(HTTPStatus.CONFLICT, f'{desc} [id={object_id}] был изменен')
+
     @auth.login_required
     def patch(self, object_id: int):
-        object_data = validate(self.validate_shema()['patch'], request.json)
+        object_data = validate_json(self.validate_shema()['patch'], request.get_data())
         object_data = self.patch_after_validate(object_data)
-        obj = self.get_object(object_id)
-        obj = self.before_patch(obj)
-        for key, value in object_data.items():
-            setattr(obj, key, value)
-        self.commit_object(obj)
-        return self.get_object_jsonify(obj)
+        model = self.object_model()
+        query = self.owned_object_filter(update(model), object_id)
+        query = query.values(**object_data, version=model.version + 1).returning(model)
+        try:
+            obj = self.session.scalars(query.execution_options(populate_existing=True)).one_or_none()
+        except IntegrityError:
+            self.session.rollback()
+            desc = self.object_description()
+            if not desc:
+                desc = self.__name__
+            raise HTTPException(HTTPStatus.BAD_REQUEST, f'{desc} уже существует')
+        if obj is None:
+            self.session.rollback()
+            self.raise_not_changed(object_id, self.before_patch)
+        # ответ собирается до commit, иначе expire_on_commit перечитает объект отдельным запросом
+        response = self.get_object_response(obj)
+        self.session.commit()
+        object_cache.delete(self.cache_key(), object_id)
+        return response
 
     def before_delete(self, data):
         return data
 
     @auth.login_required
     def delete(self, object_id: int):
-        obj = self.get_object(object_id)
-        obj = self.before_delete(obj)
-        self.session.delete(obj)
+        model = self.object_model()
+        query = self.owned_object_filter(delete(model), object_id)
+        deleted_id = self.session.scalars(query.returning(model.id)).one_or_none()
         self.session.commit()
+        if deleted_id is None:
+            self.raise_not_changed(object_id, self.before_delete)
+        object_cache.delete(self.cache_key(), object_id)
         return jsonify({'status': 'ok'})
 
 
+class ObjectBatchView(ObjectView):
+    """
+    Пакетные операции: тело запроса - список объектов (для DELETE - список id).
+    Ошибки валидации и доступа возвращаются по каждому элементу, запись в БД - одним запросом на пакет.
+    """
+
+    def get_batch(self) -> list:
+        items = request.json
+        if not isinstance(items, list):
+            raise HTTPException(HTTPStatus.BAD_REQUEST, 'Ожидается список объектов')
+        if len(items) > BATCH_MAX_SIZE:
+            raise HTTPException(HTTPStatus.BAD_REQUEST, f'Максимальный размер пакета {BATCH_MAX_SIZE}')
+        return items
+
+    def get_batch_objects(self, object_ids) -> dict:
+        model = self.object_model()
+        query = select(model).where(model.id.in_(set(object_ids))).with_for_update()
+        return {obj.id: obj for obj in self.session.scalars(query)}
+
+    def check_batch_object(self, objects: dict, object_id):
+        obj = objects.get(object_id)
+        if obj is None:
+            desc = self.object_description()
+            if not desc:
+                desc = self.__name__
+            raise HTTPException(HTTPStatus.NOT_FOUND, f'{desc} [id={object_id}] не найден')
+        return obj
+
+    def execute_batch(self, statements: list) -> list:
+        try:
+            results = []
+            for statement, rows in statements:
+                result = self.session.execute(statement, rows)
+                results.append(result.all() if result.returns_rows else None)
+            self.session.commit()
+        except IntegrityError:
+            self.session.rollback()
+            raise HTTPException(HTTPStatus.BAD_REQUEST, 'Ошибка записи пакета')
+        return results
+
+    @auth.login_required
+    def post(self):
+        items = self.get_batch()
+        results = [None] * len(items)
+        model_class = self.object_model()
+        table = model_class.__table__
+        indexes, rows = [], []
+        for index, item in enumerate(items):
+            try:
+                object_data = self.post_after_validate(validate(self.validate_shema()['post'], item))
+            except HTTPException as err:
+                results[index] = batch_error(index, err)
+                continue
+            new_object = self.post_after_create(model_class(**object_data))
+            row = {column.key: getattr(new_object, column.key) for column in table.columns
+                   if getattr(new_object, column.key) is not None}
+            row['version'] = 1
+            indexes.append(index)
+            rows.append(row)
+        if rows:
+            statement = insert(table).returning(*table.columns, sort_by_parameter_order=True)
+            new_rows, = self.execute_batch([(statement, rows)])
+            for index, new_row in zip(indexes, new_rows):
+                results[index] = {'index': index, 'status': HTTPStatus.CREATED,
+                                  'object': self.object_to_dict(new_row)}
+        return json_response({'items': results})
+
+    @auth.login_required
+    def patch(self):
+        items = self.get_batch()
+        results = [None] * len(items)
+        updates = {}
+        for index, item in enumerate(items):
+            try:
+                object_id = item.get('id') if isinstance(item, dict) else None
+                if not isinstance(object_id, int):
+                    raise HTTPException(HTTPStatus.BAD_REQUEST, 'Не указан id объекта')
+                object_data = self.patch_after_validate(validate(self.validate_shema()['patch'], item))
+                object_data.pop('id', None)
+                updates[index] = object_id, object_data
+            except HTTPException as err:
+                results[index] = batch_error(index, err)
+
+        objects = self.get_batch_objects(object_id for object_id, _ in updates.values())
+        groups = {}
+        for index, (object_id, object_data) in updates.items():
+            try:
+                self.before_patch(self.check_batch_object(objects, object_id))
+            except HTTPException as err:
+                results[index] = batch_error(index, err)
+                continue
+            groups.setdefault(tuple(sorted(object_data)), []).append({'_id': object_id, **object_data})
+            results[index] = {'index': index, 'status': HTTPStatus.OK, 'id': object_id}
+
+        # один executemany на каждый набор изменяемых полей, все в одной транзакции
+        table = self.object_model().__table__
+        statement = update(table).where(table.c.id == bindparam('_id')).values(version=table.c.version + 1)
+        self.execute_batch([(statement, rows) for rows in groups.values()])
+        for rows in groups.values():
+            for row in rows:
+                object_cache.delete(self.cache_key(), row['_id'])
+        return json_response({'items': results})
+
+    @auth.login_required
+    def delete(self):
+        items = self.get_batch()
+        results = [None] * len(items)
+        objects = self.get_batch_objects(item for item in items if isinstance(item, int))
+        object_ids = []
+        for index, object_id in enumerate(items):
+            try:
+                if not isinstance(object_id, int):
+                    raise HTTPException(HTTPStatus.BAD_REQUEST, 'Не указан id объекта')
+                self.before_delete(self.check_batch_object(objects, object_id))
+            except HTTPException as err:
+                results[index] = batch_error(index, err)
+                continue
+            object_ids.append(object_id)
+            results[index] = {'index': index, 'status': HTTPStatus.OK, 'id': object_id}
+        if object_ids:
+            table = self.object_model().__table__
+            self.execute_batch([(delete(table).where(table.c.id.in_(object_ids)), None)])
+            for object_id in object_ids:
+                object_cache.delete(self.cache_key(), object_id)
+        return json_response({'items': results})
+
+
 class UserView(ObjectView):
+    shemas = {'post': CreateUser, 'patch': PatchUser}
+    serializer = ObjectSerializer({'id': 'id', 'name': 'name', 'create_datetime': 'create_datetime'})
+
     def object_description(self) -> str:
         return 'Пользователь'
 
     def object_model(self):
         return User
 
-    def get_object_jsonify(self, instance):
-        return jsonify(
-            {'id': instance.id, 'name': instance.name, 'create_datetime': instance.create_datetime.isoformat()})
-
-    def validate_shema(self) -> dict:
-        return {'post': CreateUser, 'patch': PatchUser}
-
     def post_after_validate(self, data):
         data['password'] = hash_password(data['password'])
         return data
@@ -197,20 +538,31 @@ class UserView(ObjectView):
         self.check_user_access(data.id, data.id, 'удалить')
         return data
 
+    def owner_column(self):
+        return User.id
+
 
 class StickerView(ObjectView):
+    shemas = {'post': CreateSticker, 'patch': PatchSticker, 'list': ListSticker}
+    serializer = ObjectSerializer({'id': 'id', 'name': 'title', 'description': 'description', 'owner_id': 'owner_id',
+                                   'create_datetime': 'create_datetime'})
+
     def object_description(self) -> str:
         return 'Объявление'
 
     def object_model(self):
         return Sticker
 
-    def get_object_jsonify(self, instance):
-        return jsonify({'id': instance.id, 'name': instance.title, 'description': instance.description,
-                        'owner_id': instance.owner_id, 'create_datetime': instance.create_datetime.isoformat()})
-
-    def validate_shema(self) -> dict:
-        return {'post': CreateSticker, 'patch': PatchSticker}
+    def list_query(self, params: dict, cursor: tuple = None):
+        query = select(Sticker.id, Sticker.title, Sticker.description, Sticker.owner_id, Sticker.create_datetime)
+        if params.get('owner_id') is not None:
+            query = query.where(Sticker.owner_id == params['owner_id'])
+        if params.get('title'):
+            query = query.where(Sticker.title.startswith(params['title'], autoescape=True))
+        if cursor is not None:
+            query = query.where(tuple_(Sticker.create_datetime, Sticker.id) <
+                                 tuple_(*cursor, types=[Sticker.create_datetime.type, Sticker.id.type]))
+        return query.order_by(Sticker.create_datetime.desc(), Sticker.id.desc())
 
     def post_after_create(self, obj):
         obj.owner_id = request.user_id
@@ -236,15 +588,24 @@ class StickerView(ObjectView):
         self.check_owner_access(data.id, data.owner_id, 'удалить')
         return data
 
+    def owner_column(self):
+        return Sticker.owner_id
+
+
+class StickerBatchView(ObjectBatchView, StickerView):
+    pass
+
 
 user_view = UserView.as_view('user_view')
 sticker_view = StickerView.as_view('sticker_view')
+sticker_batch_view = StickerBatchView.as_view('sticker_batch_view')
 
 app.add_url_rule('/user/<int:object_id>/', view_func=user_view, methods=['GET', 'PATCH', 'DELETE'])
 app.add_url_rule('/user/', view_func=user_view, methods=['POST'])
 
 app.add_url_rule('/sticker/<int:object_id>/', view_func=sticker_view, methods=['GET', 'PATCH', 'DELETE'])
-app.add_url_rule('/sticker/', view_func=sticker_view, methods=['POST'])
+app.add_url_rule('/sticker/', view_func=sticker_view, methods=['GET', 'POST'])
+app.add_url_rule('/sticker/batch', view_func=sticker_batch_view, methods=['POST', 'PATCH', 'DELETE'])
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from models import Base, People, PEOPLE_LINKS, PEOPLE_VIEW, RESOURCE_MODELS, enable_bulk_pragmas, people_view_sql
+from swapi_stub import RESOURCES
+
+FLAT_TABLE = 'swapi_people_flat'
+
+QUERIES = {
+    'flat LIKE': f"SELECT id, name FROM {FLAT_TABLE} WHERE ',' || films || ',' LIKE '%,' || :title || ',%'",
+    'view LIKE': f"SELECT id, name FROM {PEOPLE_VIEW} WHERE ',' || films || ',' LIKE '%,' || :title || ',%'",
+    'join by title': 'SELECT p.id, p.name FROM swapi_film f JOIN swapi_people_films l ON l.film_id = f.id '
+                     'JOIN swapi_person p ON p.id = l.person_id WHERE f.name = :title',
+    'join by film_id': 'SELECT p.id, p.name FROM swapi_people_films l JOIN swapi_person p ON p.id = l.person_id '
+                       'WHERE l.film_id = :film_id',
+}
+
+
+def make_rows(scale: int) -> dict:
+    """
+    Синтетические данные в scale раз больше SWAPI: справочники, персонажи и связи
+    """
+    random.seed(0)
+    counts = {resource: count * scale for resource, count in RESOURCES.items()}
+    rows = {resource: [{'id': number, 'name': f'{resource} {number}'} for number in range(1, counts[resource] + 1)]
+            for resource in RESOURCE_MODELS}
+    rows['people'] = [{'id': number, 'name': f'People {number}', 'birth_year': f'{number}BBY', 'eye_color': 'blue',
+                       'gender': 'male', 'hair_color': 'blond', 'height': '172', 'mass': '77', 'skin_color': 'fair',
+                       'homeworld_id': random.randint(1, counts['planets']), 'edited': '2014-12-20T21:17:56.891000Z'}
+                      for number in range(1, counts['people'] + 1)]
+    links_per_person = {'films': 3, 'species': 1, 'starships': 1, 'vehicles': 1}
+    for field, (_, column) in PEOPLE_LINKS.items():
+        rows[field + '_links'] = [{'person_id': person['id'], 'position': position, column: resource_id}
+                                  for person in rows['people']
+                                  for position, resource_id in enumerate(
+                                      random.sample(range(1, counts[field] + 1), links_per_person[field]))]
+    return rows
+
+
+async def fill_db(engine, rows: dict):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.execute(text(f'DROP VIEW IF EXISTS {PEOPLE_VIEW}'))
+        await conn.execute(text(f'DROP TABLE IF EXISTS {FLAT_TABLE}'))
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(text(people_view_sql(conn.dialect.name)))
+        for resource, model in RESOURCE_MODELS.items():
+            await conn.execute(insert(model), rows[resource])
+        await conn.execute(insert(People), rows['people'])
+        for field, (link, _) in PEOPLE_LINKS.items():
+            await conn.execute(insert(link), rows[field + '_links'])
+        # прежняя плоская таблица с именами через запятую
+        await conn.execute(text(f'CREATE TABLE {FLAT_TABLE} AS SELECT * FROM {PEOPLE_VIEW}'))
+
+
+async def bench_film_people(path: str, scale: int, lookups: int):
+    """
+    Все персонажи фильма: LIKE по плоской таблице и по представлению против JOIN по индексу таблицы связей
+    """
+    engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    rows = make_rows(scale)
+    start = time.perf_counter()
+    await fill_db(engine, rows)
+    print(f'scale={scale} people={len(rows["people"])} films={len(rows["films"])} '
+          f'film_links={len(rows["films_links"])} fill={time.perf_counter() - start:.1f}s')
+
+    film_ids = [random.randint(1, len(rows['films'])) for _ in range(lookups)]
+    results = {}
+    async with engine.connect() as conn:
+        for title, query in QUERIES.items():
+            # представление пересчитывает все строки на каждый запрос - хватит нескольких замеров
+            count = min(lookups, 5) if title == 'view LIKE' else lookups
+            latency = []
+            for film_id in film_ids[:count]:
+                params = {'title': f'films {film_id}', 'film_id': film_id}
+                started = time.perf_counter()
+                found = (await conn.execute(text(query), params)).all()
+                latency.append(time.perf_counter() - started)
+                results.setdefault(film_id, {})[title] = sorted(found)
+            print(f'{title:<16} n={count:<5} mean={statistics.mean(latency) * 1000:8.2f}ms '
+                  f'max={max(latency) * 1000:8.2f}ms')
+    assert all(len({tuple(found) for found in by_query.values()}) == 1 for by_query in results.values())
+    await engine.dispose()
+
+
+def make_people(first_id: int, count: int) -> list:
+    return [{'id': number, 'name': f'People {number}', 'birth_year': f'{number}BBY', 'eye_color': 'blue',
+             'gender': 'male', 'hair_color': 'blond', 'height': '172', 'mass': '77', 'skin_color': 'fair',
+             'homeworld_id': None, 'edited': '2014-12-20T21:17:56.891000Z'}
+            for number in range(first_id, first_id + count)]
+
+
+async def load_people(path: str, rows: int, batch_size: int, bulk: bool) -> float:
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    if bulk:
+        await enable_bulk_pragmas(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    start = time.perf_counter()
+    for first_id in range(1, rows + 1, batch_size):
+        people = make_people(first_id, min(batch_size, rows + 1 - first_id))
+        async with session_maker() as session:
+            if bulk:
+                await session.execute(insert(People), people)
+            else:
+                session.add_all([People(**item) for item in people])
+            await session.commit()
+    duration = time.perf_counter() - start
+    await engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return duration
+
+
+async def bench_bulk_load(path: str, rows: int, batch_size: int):
+    """
+    Загрузка rows синтетических персонажей пачками по batch_size: add_all с настройками SQLite по умолчанию
+    против --bulk (PRAGMA + executemany Core)
+    """
+    for title, bulk in (('add_all', False), ('bulk', True)):
+        duration = await load_people(path, rows, batch_size, bulk)
+        print(f'{title:<8} rows={rows} batch={batch_size} duration={duration:.1f}s rows_per_sec={rows / duration:.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='benchmark.db')
+    parser.add_argument('--scale', type=int, default=100, help='во сколько раз больше данных, чем в SWAPI')
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--load', type=int, default=0, help='сравнить загрузку N персонажей с --bulk и без')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+    try:
+        if args.load:
+            asyncio.run(bench_bulk_load(args.db, args.load, args.batch_size))
+        else:
+            asyncio.run(bench_film_people(args.db, args.scale, args.lookups))
+    finally:
+        if os.path.exists(args.db):
+            os.remove(args.db)
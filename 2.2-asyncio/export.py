@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import resource
+import time
+from functools import partial
+
+from sqlalchemy import select
+
+from models import engine, people_view, RESOURCE_MODELS
+
+# что выгружается: имя файла -> таблица или представление
+EXPORT_SOURCES = {'people': people_view, **{name: model.__table__ for name, model in RESOURCE_MODELS.items()}}
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 10000))
+
+logger = logging.getLogger('swapi.export')
+
+
+class NdjsonWriter:
+    """
+    JSON Lines, по объекту в строке. compression: none или gzip
+    """
+
+    def __init__(self, path: str, columns, compression: str = 'none'):
+        if compression not in ('none', 'gzip'):
+            raise ValueError(f'Сжатие {compression} не поддерживается для ndjson')
+        if compression == 'gzip':
+            self.path = path + '.gz'
+            self.file = gzip.open(self.path, 'wt', encoding='utf-8')
+        else:
+            self.path = path
+            self.file = open(self.path, 'w', encoding='utf-8')
+
+    def write(self, rows: list):
+        self.file.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+def open_parquet(path: str, schema, codec):
+    # чанк - row group
+    import pyarrow.parquet as pq
+    return pq.ParquetWriter(path, schema, compression=codec or 'none')
+
+
+def open_arrow_ipc(path: str, schema, codec):
+    # файл Arrow IPC, чанк - record batch
+    import pyarrow.ipc as ipc
+    return ipc.new_file(path, schema, options=ipc.IpcWriteOptions(compression=codec))
+
+
+class ArrowWriter:
+    """
+    Запись чанков через pyarrow (pip install pyarrow). Схема - по типам колонок SQLAlchemy,
+    opener(path, schema, codec) открывает файл нужного формата
+    """
+
+    def __init__(self, path: str, columns, compression: str = 'none', opener=open_parquet):
+        import pyarrow as pa
+        self.pa = pa
+        types = {int: pa.int64(), str: pa.string(), bool: pa.bool_(), float: pa.float64()}
+        self.schema = pa.schema([(item.name, types[item.type.python_type]) for item in columns])
+        self.path = path
+        self.writer = opener(path, self.schema, None if compression == 'none' else compression)
+
+    def write(self, rows: list):
+        self.writer.write_table(self.pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+FORMATS = {'ndjson': ('.ndjson', NdjsonWriter),
+           'parquet': ('.parquet', partial(ArrowWriter, opener=open_parquet)),
+           'arrow': ('.arrow', partial(ArrowWriter, opener=open_arrow_ipc))}
+
+
+async def export_source(name: str, source, out_dir: str, file_format: str, compression: str, chunk_size: int) -> dict:
+    """
+    Выгрузка таблицы потоком: в памяти не больше одного чанка строк
+    """
+    extension, writer_class = FORMATS[file_format]
+    columns = list(source.columns)
+    writer = writer_class(os.path.join(out_dir, name + extension), columns, compression)
+    rows = chunks = 0
+    start = time.perf_counter()
+    try:
+        async with engine.connect() as conn:
+            result = await conn.stream(select(source).order_by(source.c.id).execution_options(yield_per=chunk_size))
+            async for partition in result.mappings().partitions(chunk_size):
+                writer.write([dict(row) for row in partition])
+                rows += len(partition)
+                chunks += 1
+    finally:
+        writer.close()
+    return {'name': name, 'path': writer.path, 'rows': rows, 'chunks': chunks,
+            'bytes': os.path.getsize(writer.path), 'duration': time.perf_counter() - start}
+
+
+async def export(out_dir: str, file_format: str = 'ndjson', compression: str = 'none',
+                 chunk_size: int = EXPORT_CHUNK_SIZE, names=None):
+    os.makedirs(out_dir, exist_ok=True)
+    for name in names or EXPORT_SOURCES:
+        stats = await export_source(name, EXPORT_SOURCES[name], out_dir, file_format, compression, chunk_size)
+        logger.info('export name=%s path=%s rows=%d chunks=%d bytes=%d duration_s=%.2f max_rss_mb=%.0f',
+                    stats['name'], stats['path'], stats['rows'], stats['chunks'], stats['bytes'], stats['duration'],
+                    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--out', default='export')
+    parser.add_argument('--format', choices=list(FORMATS), default='ndjson')
+    parser.add_argument('--compression', default='none',
+                        help='ndjson: none, gzip; parquet: none, snappy, gzip, zstd, brotli; arrow: none, lz4, zstd')
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument('--tables', nargs='*', choices=list(EXPORT_SOURCES), help='по умолчанию все')
+    args = parser.parse_args()
+    logging.basicConfig(level='INFO', format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    asyncio.run(export(args.out, args.format, args.compression, args.chunk_size, args.tables))
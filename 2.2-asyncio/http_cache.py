@@ -0,0 +1,59 @@
+import sqlite3
+import time
+import zlib
+from typing import NamedTuple, Optional
+
+
+class CacheMiss(Exception):
+    pass
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+class HttpCache:
+    """
+    Кэш ответов API на диске: URL -> тело (zlib), ETag, Last-Modified, время получения.
+    Обычный sqlite3: записи маленькие и запросы к кэшу быстрее переключения в поток
+    """
+
+    def __init__(self, path: str, max_age: float = 86400):
+        self.path = path
+        self.max_age = max_age
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS http_cache ('
+                                'url TEXT PRIMARY KEY, body BLOB NOT NULL, etag TEXT, last_modified TEXT, '
+                                'fetched_at REAL NOT NULL)')
+        self.connection.commit()
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        row = self.connection.execute('SELECT body, etag, last_modified, fetched_at FROM http_cache WHERE url = ?',
+                                      (url,)).fetchone()
+        if row is None:
+            return None
+        body, etag, last_modified, fetched_at = row
+        return CachedResponse(zlib.decompress(body), etag, last_modified, fetched_at)
+
+    def is_fresh(self, response: CachedResponse) -> bool:
+        return response.age() < self.max_age
+
+    def set(self, url: str, body: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        self.connection.execute('INSERT OR REPLACE INTO http_cache (url, body, etag, last_modified, fetched_at) '
+                                'VALUES (?, ?, ?, ?, ?)',
+                                (url, zlib.compress(body), etag, last_modified, time.time()))
+        self.connection.commit()
+
+    def touch(self, url: str):
+        # ответ 304: данные не изменились, отсчет max_age начинается заново
+        self.connection.execute('UPDATE http_cache SET fetched_at = ? WHERE url = ?', (time.time(), url))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
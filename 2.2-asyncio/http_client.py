@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import NamedTuple, Optional
+
+import aiohttp
+from multidict import CIMultiDictProxy
+from yarl import URL
+
+logger = logging.getLogger('swapi.http')
+
+# ответы, после которых запрос повторяется
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HttpResponse(NamedTuple):
+    status: int
+    headers: CIMultiDictProxy
+    body: bytes
+
+
+class TokenBucket:
+    """
+    Ограничение частоты запросов: rate токенов в секунду, не больше burst подряд.
+    pause() останавливает выдачу токенов, например по Retry-After
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After: число секунд или HTTP-дата
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryingClient:
+    """
+    GET поверх aiohttp.ClientSession: token bucket на каждый хост, повторы при 429/5xx, таймаутах и обрывах соединения
+    с экспоненциальной задержкой и jitter, Retry-After соблюдается. Каждая попытка пишется в лог с задержкой ответа
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, rate: float = 0, burst: int = 1, retries: int = 5,
+                 backoff_base: float = 0.5, backoff_max: float = 30, timeout: aiohttp.ClientTimeout = None):
+        self.session = session
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.buckets = {}
+        self.requests = 0
+        self.retried = 0
+        self.throttled = 0
+
+    def bucket(self, url: str) -> Optional[TokenBucket]:
+        if self.rate <= 0:
+            return None
+        host = URL(url).host
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.burst)
+        return self.buckets[host]
+
+    def backoff(self, attempt: int) -> float:
+        # full jitter: случайная задержка до base * 2^attempt, чтобы повторы не приходили волной
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def get(self, url: str, headers: dict = None) -> HttpResponse:
+        bucket = self.bucket(url)
+        # timeout=None у aiohttp отключает таймаут сессии, поэтому передается только заданный
+        options = {'timeout': self.timeout} if self.timeout is not None else {}
+        attempt = 0
+        while True:
+            if bucket is not None:
+                await bucket.acquire()
+            self.requests += 1
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                async with self.session.get(url, headers=headers, **options) as response:
+                    if response.status in RETRY_STATUSES:
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                        error = f'status {response.status}'
+                    else:
+                        response.raise_for_status()
+                        body = await response.read()
+                        logger.info('method=GET url=%s status=%d attempt=%d latency_ms=%.1f bytes=%d',
+                                    url, response.status, attempt + 1, (time.perf_counter() - start) * 1000, len(body))
+                        return HttpResponse(response.status, response.headers, body)
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as err:
+                if attempt >= self.retries:
+                    raise
+                error = type(err).__name__
+            if attempt >= self.retries:
+                response.raise_for_status()
+
+            delay = self.backoff(attempt)
+            if retry_after is not None:
+                self.throttled += 1
+                delay = max(delay, retry_after)
+                if bucket is not None:
+                    # сервер просит подождать - ждут все запросы к этому хосту, а не только повтор
+                    bucket.pause(retry_after)
+            logger.warning('method=GET url=%s error="%s" attempt=%d latency_ms=%.1f retry_in_s=%.2f',
+                           url, error, attempt + 1, (time.perf_counter() - start) * 1000, delay)
+            self.retried += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def report(self) -> str:
+        return f'http_requests={self.requests} retried={self.retried} throttled={self.throttled}'
@@ -1,17 +1,45 @@
+import argparse
 import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import time
+from datetime import datetime
 
 import aiohttp
+from sqlalchemy import bindparam, delete, insert
+from yarl import URL
 
-from models import Session, init_db
-from models import People
+from http_cache import CacheMiss, HttpCache
+from http_client import RetryingClient
+from models import Session, enable_bulk_pragmas, init_db, upsert_query
+from models import People, SyncCheckpoint, PEOPLE_LINKS, RESOURCE_MODELS
 
-SWAPI_URL = 'https://swapi.dev/api/people/?format=json'
+SWAPI_BASE_URL = os.environ.get('SWAPI_BASE_URL', 'https://swapi.dev/api/')
+# одновременных запросов к API и размер пула соединений
+SWAPI_CONCURRENCY = int(os.environ.get('SWAPI_CONCURRENCY', 10))
+SWAPI_CONNECTIONS = int(os.environ.get('SWAPI_CONNECTIONS', 10))
+# запросов в секунду к одному хосту (0 - без ограничения) и сколько можно подряд
+SWAPI_RATE = float(os.environ.get('SWAPI_RATE', 20))
+SWAPI_BURST = int(os.environ.get('SWAPI_BURST', 10))
+# повторы при 429/5xx/таймаутах, задержка base * 2^попытка, но не больше max; таймауты в секундах
+SWAPI_RETRIES = int(os.environ.get('SWAPI_RETRIES', 5))
+SWAPI_BACKOFF_BASE = float(os.environ.get('SWAPI_BACKOFF_BASE', 0.5))
+SWAPI_BACKOFF_MAX = float(os.environ.get('SWAPI_BACKOFF_MAX', 30))
+SWAPI_TIMEOUT = float(os.environ.get('SWAPI_TIMEOUT', 30))
+SWAPI_CONNECT_TIMEOUT = float(os.environ.get('SWAPI_CONNECT_TIMEOUT', 10))
+# кэш ответов API на диске, пустой путь - без кэша; max age в секундах
+SWAPI_CACHE_PATH = os.environ.get('SWAPI_CACHE_PATH', 'swapi_cache.db')
+SWAPI_CACHE_MAX_AGE = float(os.environ.get('SWAPI_CACHE_MAX_AGE', 86400))
 
-HOMEWORLDS_URL = 'https://swapi.dev/api/planets/?format=json'
-FILMS_URL = 'https://swapi.dev/api/films/?format=json'
-SPECIES_URL = 'https://swapi.dev/api/species/?format=json'
-STARSHIPS_URL = 'https://swapi.dev/api/starships/?format=json'
-VEHICLES_URL = 'https://swapi.dev/api/vehicles/?format=json'
+logger = logging.getLogger('swapi')
+# запись персонажей: размер пачки, максимальная задержка пачки в секундах, число писателей и длина очереди страниц
+PEOPLE_BATCH_SIZE = int(os.environ.get('PEOPLE_BATCH_SIZE', 500))
+PEOPLE_FLUSH_INTERVAL = float(os.environ.get('PEOPLE_FLUSH_INTERVAL', 1))
+PEOPLE_WRITERS = int(os.environ.get('PEOPLE_WRITERS', 1))
+PEOPLE_QUEUE_SIZE = int(os.environ.get('PEOPLE_QUEUE_SIZE', 20))
 
 HOMEWORLDS_NAMES = {}
 FILMS_NAMES = {}
@@ -19,11 +47,128 @@ SPECIES_NAMES = {}
 STARSHIPS_NAMES = {}
 VEHICLES_NAMES = {}
 
+LOOKUPS = {'planets': HOMEWORLDS_NAMES,
+           'films': FILMS_NAMES,
+           'species': SPECIES_NAMES,
+           'starships': STARSHIPS_NAMES,
+           'vehicles': VEHICLES_NAMES}
 
-async def get_swapi_object_json(url, session):
-    print('GET', url)
-    async with session.get(url) as response:
-        return await response.json()
+
+def resource_url(base_url: str, resource: str) -> str:
+    return f'{base_url.rstrip("/")}/{resource}/?format=json'
+
+
+def page_url(url: str, page: int) -> str:
+    return str(URL(url).update_query(page=page))
+
+
+def create_client_session(connections: int = SWAPI_CONNECTIONS, timeout: float = SWAPI_TIMEOUT,
+                          connect_timeout: float = SWAPI_CONNECT_TIMEOUT) -> aiohttp.ClientSession:
+    # одно соединение на хост переиспользуется всеми запросами, DNS кэшируется
+    connector = aiohttp.TCPConnector(limit=connections, limit_per_host=connections,
+                                     ttl_dns_cache=300, keepalive_timeout=30)
+    return aiohttp.ClientSession(connector=connector,
+                                 timeout=aiohttp.ClientTimeout(total=timeout, connect=connect_timeout))
+
+
+class CrawlStats:
+
+    def __init__(self):
+        self.pages = 0
+        self.objects = 0
+        self.requests = 0
+        self.cache_hits = 0
+        self.revalidated = 0
+        self.start = time.perf_counter()
+
+    def add_page(self, results: list):
+        self.pages += 1
+        self.objects += len(results)
+
+    def report(self) -> str:
+        duration = time.perf_counter() - self.start
+        return (f'pages={self.pages} objects={self.objects} duration={duration:.2f}s '
+                f'pages_per_sec={self.pages / duration:.1f} requests={self.requests} '
+                f'cache_hits={self.cache_hits} revalidated={self.revalidated}')
+
+
+class SwapiCrawler:
+    """
+    Обход постраничных списков SWAPI: первая страница дает count,
+    остальные запрашиваются параллельно, не больше concurrency страниц в работе одновременно.
+    Свежие ответы берутся из cache без запроса, устаревшие перепроверяются по ETag/Last-Modified.
+    В режиме offline - только кэш
+    """
+
+    def __init__(self, client: RetryingClient, concurrency: int = SWAPI_CONCURRENCY,
+                 cache: HttpCache = None, offline: bool = False):
+        if offline and cache is None:
+            raise ValueError('Для режима offline нужен кэш')
+        self.client = client
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.cache = cache
+        self.offline = offline
+        self.stats = CrawlStats()
+
+    async def get_json(self, url: str) -> dict:
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is not None and (self.offline or self.cache.is_fresh(cached)):
+            self.stats.cache_hits += 1
+            return json.loads(cached.body)
+        if self.offline:
+            raise CacheMiss(f'Нет в кэше: {url}')
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+        async with self.semaphore:
+            response = await self.client.get(url, headers)
+        self.stats.requests += 1
+        if response.status == 304 and cached is not None:
+            self.cache.touch(url)
+            self.stats.revalidated += 1
+            return json.loads(cached.body)
+        if self.cache is not None:
+            self.cache.set(url, response.body, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return json.loads(response.body)
+
+    async def get_page(self, url: str, page: int) -> tuple:
+        results = (await self.get_json(page_url(url, page)))['results']
+        self.stats.add_page(results)
+        return page, results
+
+    async def iter_pages(self, url: str, start_page: int = 1):
+        """
+        Пары (номер страницы, результаты) в порядке получения. Страницы до start_page пропускаются,
+        первая запрашивается всегда - ради count
+        """
+        first_page = await self.get_json(url)
+        results = first_page['results']
+        self.stats.add_page(results)
+        if start_page <= 1:
+            yield 1, results
+        if first_page['next'] is None or not results:
+            return
+        pages_count = math.ceil(first_page['count'] / len(results))
+        pages = iter(range(max(2, start_page), pages_count + 1))
+        # не больше concurrency страниц в работе: пока потребитель не забрал результат, новые не запрашиваются
+        pending = set()
+        try:
+            while True:
+                for page in itertools.islice(pages, self.concurrency - len(pending)):
+                    pending.add(asyncio.create_task(self.get_page(url, page)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
 
 
 async def get_swapi_object_name(data) -> dict:
@@ -42,70 +187,375 @@ async def get_swapi_object_name(data) -> dict:
     return {key: name}
 
 
-async def get_swapi_people_model_json(data) -> dict:
-    return {"id": int(data['url'].split('/')[-2]),
-            "name": data['name'],
-            "birth_year": data['birth_year'],
-            "eye_color": data['eye_color'],
-            "gender": data['gender'],
-            "hair_color": data['hair_color'],
-            "height": data['height'],
-            "homeworld": HOMEWORLDS_NAMES[data['homeworld'].split('/')[-2]],
-            "mass": data['mass'],
-            "skin_color": data['skin_color'],
-            "films": ','.join([FILMS_NAMES[item.split('/')[-2]] for item in data['films']]),
-            "species": ','.join([SPECIES_NAMES[item.split('/')[-2]] for item in data['species']]),
-            "starships": ','.join([STARSHIPS_NAMES[item.split('/')[-2]] for item in data['starships']]),
-            "vehicles": ','.join([VEHICLES_NAMES[item.split('/')[-2]] for item in data['vehicles']])}
-
-
-async def swapi_paste_to_db(data):
+class ReferenceResolver:
+    """
+    Имена по ссылкам на планеты, фильмы, расы, корабли и транспорт.
+    Имена приходят из обхода списков (LOOKUPS). Если имени нет, а обход списка ресурса еще идет - ждем его,
+    если нет и после обхода - объект запрашивается по ссылке. Одновременные запросы одной ссылки объединяются в один
+    """
+
+    def __init__(self, crawler: SwapiCrawler, lookups: dict = LOOKUPS):
+        self.crawler = crawler
+        self.lookups = lookups
+        self.crawls = {}
+        self.pending = {}
+        self.fetched = 0
+
+    def start_crawls(self, base_url: str):
+        for resource, object_dict in self.lookups.items():
+            url = resource_url(base_url, resource)
+            self.crawls[resource] = asyncio.create_task(load_swapi_objects(self.crawler, url, object_dict))
+
+    async def wait_crawls(self):
+        await asyncio.gather(*self.crawls.values())
+
+    async def cancel_crawls(self):
+        for task in self.crawls.values():
+            task.cancel()
+        await asyncio.gather(*self.crawls.values(), return_exceptions=True)
+
+    async def resolve(self, url: str) -> str:
+        resource, key = url.split('/')[-3:-1]
+        object_dict = self.lookups[resource]
+        if key not in object_dict:
+            crawl = self.crawls.get(resource)
+            if crawl is not None and not crawl.done():
+                await asyncio.shield(crawl)
+            if key not in object_dict:
+                await self.fetch(url, object_dict)
+        return object_dict[key]
+
+    async def fetch(self, url: str, object_dict: dict):
+        task = self.pending.get(url)
+        if task is None:
+            task = asyncio.create_task(self.crawler.get_json(url))
+            # после ошибки ссылку можно будет запросить снова
+            task.add_done_callback(lambda _: self.pending.pop(url, None))
+            self.pending[url] = task
+            self.fetched += 1
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        object_dict.update(await get_swapi_object_name(await asyncio.shield(task)))
+
+
+def reference_id(url: str) -> int:
+    return int(url.split('/')[-2])
+
+
+class PeopleRows:
+    """
+    Строки пачки персонажей в нормализованной схеме: персонажи, справочники по ссылкам, связи
+    """
+
+    def __init__(self):
+        self.people = []
+        self.resources = {resource: {} for resource in RESOURCE_MODELS}
+        self.links = {field: [] for field in PEOPLE_LINKS}
+        self.link_counts = {field: [] for field in PEOPLE_LINKS}
+
+    @classmethod
+    async def build(cls, data: list, resolver: ReferenceResolver) -> 'PeopleRows':
+        urls = {item['homeworld'] for item in data if item.get('homeworld')}
+        for field in PEOPLE_LINKS:
+            urls.update(url for item in data for url in item[field])
+        urls = list(urls)
+        names = dict(zip(urls, await asyncio.gather(*[resolver.resolve(url) for url in urls])))
+        rows = cls()
+        for item in data:
+            rows.add(item, names)
+        return rows
+
+    def add(self, data: dict, names: dict):
+        person_id = reference_id(data['url'])
+        homeworld_id = None
+        if data.get('homeworld'):
+            homeworld_id = reference_id(data['homeworld'])
+            self.resources['planets'][homeworld_id] = names[data['homeworld']]
+        self.people.append({"id": person_id,
+                            "name": data['name'],
+                            "birth_year": data['birth_year'],
+                            "eye_color": data['eye_color'],
+                            "gender": data['gender'],
+                            "hair_color": data['hair_color'],
+                            "height": data['height'],
+                            "homeworld_id": homeworld_id,
+                            "mass": data['mass'],
+                            "skin_color": data['skin_color'],
+                            "edited": data.get('edited')})
+        for field, (_, column) in PEOPLE_LINKS.items():
+            for position, url in enumerate(data[field]):
+                resource_id = reference_id(url)
+                self.resources[field][resource_id] = names[url]
+                self.links[field].append({'person_id': person_id, 'position': position, column: resource_id})
+            self.link_counts[field].append({'link_person_id': person_id, 'link_count': len(data[field])})
+
+
+async def swapi_resources_to_db(session, resources: dict):
+    for resource, object_dict in resources.items():
+        if object_dict:
+            await session.execute(upsert_query(RESOURCE_MODELS[resource]),
+                                  [{'id': int(key), 'name': name} for key, name in object_dict.items()])
+
+
+async def swapi_lookups_to_db(lookups: dict = LOOKUPS):
+    # справочники целиком, в том числе объекты, на которые не ссылается ни один персонаж
     async with Session() as session:
-        people = [People(**await get_swapi_people_model_json(item)) for item in data]
+        await swapi_resources_to_db(session, lookups)
+        await session.commit()
 
-        session.add_all(people)
-        print('Commit', len(people), 'people')
+
+async def swapi_paste_to_db(data, resolver: ReferenceResolver):
+    rows = await PeopleRows.build(data, resolver)
+    async with Session() as session:
+        await swapi_resources_to_db(session, rows.resources)
+        session.add_all([People(**item) for item in rows.people])
+        session.add_all([link(**item) for field, (link, _) in PEOPLE_LINKS.items() for item in rows.links[field]])
+        logger.info('Commit %d people', len(rows.people))
         await session.commit()
 
 
-async def load_swapi_objects(url, session, object_dict):
-    swapi_objects_json = await get_swapi_object_json(url, session)
-    dict_list = [await get_swapi_object_name(item) for item in swapi_objects_json['results']]
-    for d in dict_list:
-        object_dict.update(d)
-    if swapi_objects_json['next'] is not None:
-        await load_swapi_objects(swapi_objects_json['next'], session, object_dict)
-    else:
-        await session.close()
+async def swapi_bulk_to_db(data, resolver: ReferenceResolver):
+    # executemany-вставки Core без unit of work: ни объектов, ни identity map
+    rows = await PeopleRows.build(data, resolver)
+    async with Session() as session:
+        await swapi_resources_to_db(session, rows.resources)
+        await session.execute(insert(People), rows.people)
+        for field, (link, _) in PEOPLE_LINKS.items():
+            if rows.links[field]:
+                await session.execute(insert(link), rows.links[field])
+        logger.info('Bulk insert %d people', len(rows.people))
+        await session.commit()
+
+
+async def swapi_upsert_to_db(data, resolver: ReferenceResolver):
+    rows = await PeopleRows.build(data, resolver)
+    async with Session() as session:
+        await swapi_resources_to_db(session, rows.resources)
+        await session.execute(upsert_query(People), rows.people)
+        for field, (link, _) in PEOPLE_LINKS.items():
+            if rows.links[field]:
+                await session.execute(upsert_query(link), rows.links[field])
+            # связи за концом списка: у персонажа стало меньше фильмов, кораблей и т.д.
+            await session.execute(delete(link.__table__).where(link.person_id == bindparam('link_person_id'),
+                                                               link.position >= bindparam('link_count')),
+                                  rows.link_counts[field])
+        logger.info('Upsert %d people', len(rows.people))
+        await session.commit()
+
+
+class SyncProgress:
+    """
+    Прогресс инкрементальной загрузки ресурса. Страницы записываются не по порядку,
+    в чекпоинт попадает последняя страница, до которой записаны все предыдущие
+    """
+
+    def __init__(self, resource: str, last_page: int = 0, last_edited: str = None):
+        self.resource = resource
+        self.last_page = last_page
+        self.last_edited = last_edited
+        self.pages = set()
+
+    @classmethod
+    async def load(cls, resource: str) -> 'SyncProgress':
+        async with Session() as session:
+            checkpoint = await session.get(SyncCheckpoint, resource)
+        if checkpoint is None:
+            return cls(resource)
+        if checkpoint.finished:
+            # прошлая загрузка закончена - проходим все страницы заново, неизменные строки не перезапишутся
+            return cls(resource, last_edited=checkpoint.last_edited)
+        return cls(resource, checkpoint.last_page, checkpoint.last_edited)
+
+    async def mark(self, pages: list, data: list):
+        self.pages.update(pages)
+        while self.last_page + 1 in self.pages:
+            self.last_page += 1
+            self.pages.remove(self.last_page)
+        edited = [item['edited'] for item in data if item.get('edited')]
+        if edited:
+            self.last_edited = max([self.last_edited or '', *edited])
+        await self.save()
+
+    async def save(self, finished: bool = False):
+        async with Session() as session:
+            await session.merge(SyncCheckpoint(resource=self.resource, last_page=self.last_page,
+                                               last_edited=self.last_edited, finished=finished,
+                                               synced_at=datetime.now()))
+            await session.commit()
+
+
+class PeopleWriter:
+    """
+    Запись персонажей из ограниченной очереди страниц.
+    Писатели собирают страницы в пачки по batch_size персонажей или за flush_interval секунд и пишут пачку одной транзакцией.
+    Пока очередь полна, put() ждет - загрузка страниц притормаживает. Ошибка записи поднимается из put() и close()
+    """
+
+    _stop = object()
+
+    def __init__(self, workers: int = PEOPLE_WRITERS, batch_size: int = PEOPLE_BATCH_SIZE,
+                 flush_interval: float = PEOPLE_FLUSH_INTERVAL, queue_size: int = PEOPLE_QUEUE_SIZE,
+                 progress: SyncProgress = None, resolver: ReferenceResolver = None, bulk: bool = False):
+        self.progress = progress
+        self.bulk = bulk
+        self.resolver = resolver
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.tasks = []
+        self.written = 0
+
+    async def __aenter__(self):
+        self.tasks = [asyncio.create_task(self.consume()) for _ in range(self.workers)]
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.close()
+        else:
+            await self.cancel()
+
+    def check(self):
+        for task in self.tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    async def put(self, page: int, results: list):
+        await self.put_item((page, results))
+
+    async def put_item(self, item):
+        self.check()
+        if not self.queue.full():
+            self.queue.put_nowait(item)
+            return
+        put_task = asyncio.create_task(self.queue.put(item))
+        # ждем место в очереди или падения писателя, иначе при упавших писателях put() ждал бы вечно
+        await asyncio.wait([put_task, *self.tasks], return_when=asyncio.FIRST_COMPLETED)
+        if not put_task.done():
+            put_task.cancel()
+        self.check()
+
+    async def close(self):
+        for _ in self.tasks:
+            await self.put_item(self._stop)
+        await asyncio.gather(*self.tasks)
+
+    async def cancel(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def consume(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        pages = []
+        flush_at = None
+        while True:
+            try:
+                if pages:
+                    item = await asyncio.wait_for(self.queue.get(), max(0, flush_at - loop.time()))
+                else:
+                    item = await self.queue.get()
+            except asyncio.TimeoutError:
+                item = None
+            if item is self._stop:
+                break
+            if item is not None:
+                if not pages:
+                    flush_at = loop.time() + self.flush_interval
+                page, results = item
+                pages.append(page)
+                batch.extend(results)
+            if pages and (len(batch) >= self.batch_size or loop.time() >= flush_at):
+                await self.flush(batch, pages)
+                batch = []
+                pages = []
+        if pages:
+            await self.flush(batch, pages)
+
+    async def flush(self, batch: list, pages: list):
+        if self.progress is None:
+            if batch:
+                await (swapi_bulk_to_db if self.bulk else swapi_paste_to_db)(batch, self.resolver)
+        else:
+            if batch:
+                await swapi_upsert_to_db(batch, self.resolver)
+            # чекпоинт - после коммита данных: при падении между ними страницы просто загрузятся повторно
+            await self.progress.mark(pages, batch)
+        self.written += len(batch)
+
+
+async def load_swapi_objects(crawler: SwapiCrawler, url, object_dict):
+    async for _, results in crawler.iter_pages(url):
+        for item in results:
+            object_dict.update(await get_swapi_object_name(item))
 
 
-async def load_swapi_people(url, session):
-    swapi_people_json = await get_swapi_object_json(url, session)
-    asyncio.create_task(swapi_paste_to_db(swapi_people_json['results']))
-    if swapi_people_json['next'] is not None:
-        await load_swapi_people(swapi_people_json['next'], session)
+async def load_swapi_people(crawler: SwapiCrawler, url, writer: PeopleWriter, start_page: int = 1):
+    async for page, results in crawler.iter_pages(url, start_page):
+        await writer.put(page, results)
 
 
-async def load_swapi_dict(url, di):
-    session = aiohttp.ClientSession()
-    task = asyncio.create_task(load_swapi_objects(url, session, di))
-    return task
+async def main(args):
+    if args.bulk:
+        await enable_bulk_pragmas()
+    await init_db(drop=not args.incremental)
+    progress = await SyncProgress.load('people') if args.incremental else None
+    start_page = progress.last_page + 1 if progress is not None else 1
 
+    cache = HttpCache(args.cache_path, args.cache_max_age) if args.cache_path else None
+    try:
+        async with create_client_session(args.connections, args.timeout, args.connect_timeout) as session:
+            client = RetryingClient(session, args.rate, args.burst, args.retries, args.backoff_base, args.backoff_max)
+            crawler = SwapiCrawler(client, args.concurrency, cache, args.offline)
+            # персонажи загружаются одновременно со списками, имена по ссылкам - по мере надобности
+            resolver = ReferenceResolver(crawler)
+            resolver.start_crawls(args.base_url)
+            try:
+                async with PeopleWriter(args.writers, args.batch_size, args.flush_interval, args.queue_size,
+                                        progress, resolver, args.bulk) as writer:
+                    await load_swapi_people(crawler, resource_url(args.base_url, 'people'), writer, start_page)
+                await resolver.wait_crawls()
+                await swapi_lookups_to_db()
+            finally:
+                await resolver.cancel_crawls()
+            if progress is not None:
+                await progress.save(finished=True)
+    finally:
+        if cache is not None:
+            cache.close()
+    logger.info('%s %s people_written=%d references_fetched=%d',
+                crawler.stats.report(), client.report(), writer.written, resolver.fetched)
 
-async def main():
-    await init_db()
 
-    task_list = [await load_swapi_dict(HOMEWORLDS_URL, HOMEWORLDS_NAMES),
-                 await load_swapi_dict(FILMS_URL, FILMS_NAMES),
-                 await load_swapi_dict(SPECIES_URL, SPECIES_NAMES),
-                 await load_swapi_dict(STARSHIPS_URL, STARSHIPS_NAMES),
-                 await load_swapi_dict(VEHICLES_URL, VEHICLES_NAMES)]
-    await asyncio.gather(*task_list)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base-url', default=SWAPI_BASE_URL, help='например, http://127.0.0.1:8081/api/ для swapi_stub.py')
+    parser.add_argument('--concurrency', type=int, default=SWAPI_CONCURRENCY)
+    parser.add_argument('--connections', type=int, default=SWAPI_CONNECTIONS)
+    parser.add_argument('--rate', type=float, default=SWAPI_RATE, help='запросов в секунду к хосту, 0 - без ограничения')
+    parser.add_argument('--burst', type=int, default=SWAPI_BURST)
+    parser.add_argument('--retries', type=int, default=SWAPI_RETRIES)
+    parser.add_argument('--backoff-base', type=float, default=SWAPI_BACKOFF_BASE)
+    parser.add_argument('--backoff-max', type=float, default=SWAPI_BACKOFF_MAX)
+    parser.add_argument('--timeout', type=float, default=SWAPI_TIMEOUT)
+    parser.add_argument('--connect-timeout', type=float, default=SWAPI_CONNECT_TIMEOUT)
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument('--cache-path', default=SWAPI_CACHE_PATH, help='пустая строка - без кэша')
+    parser.add_argument('--cache-max-age', type=float, default=SWAPI_CACHE_MAX_AGE)
+    parser.add_argument('--offline', action='store_true', help='только из кэша, без запросов к API')
+    parser.add_argument('--incremental', action='store_true',
+                        help='upsert по id с чекпоинтами вместо пересоздания таблиц, прерванная загрузка продолжается')
+    parser.add_argument('--bulk', action='store_true',
+                        help='массовая загрузка: WAL, synchronous=NORMAL, большой кэш SQLite и вставки Core')
+    parser.add_argument('--batch-size', type=int, default=PEOPLE_BATCH_SIZE)
+    parser.add_argument('--flush-interval', type=float, default=PEOPLE_FLUSH_INTERVAL)
+    parser.add_argument('--writers', type=int, default=PEOPLE_WRITERS)
+    parser.add_argument('--queue-size', type=int, default=PEOPLE_QUEUE_SIZE)
+    return parser.parse_args(argv)
 
-    async with aiohttp.ClientSession() as session:
-        await load_swapi_people(SWAPI_URL, session)
-        task_to_await = asyncio.all_tasks() - {asyncio.current_task()}
-        await asyncio.gather(*task_to_await)
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    args = parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    asyncio.run(main(args))
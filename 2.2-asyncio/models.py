@@ -1,34 +1,199 @@
+import os
+from datetime import datetime
+
+from sqlalchemy import ForeignKey, Index, Integer, String, column, event, inspect, or_, table, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
-engine = create_async_engine('sqlite+aiosqlite:///contacts.db')
+DB_DSN = os.environ.get('DB_DSN', 'sqlite+aiosqlite:///contacts.db')
+
+engine = create_async_engine(DB_DSN)
 Session = async_sessionmaker(engine, expire_on_commit=False)
 
+# PRAGMA для массовой загрузки в SQLite: WAL, fsync только на контрольных точках, кэш страниц 64 МБ
+SQLITE_BULK_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -65536, 'temp_store': 'MEMORY'}
+
 
 class Base(AsyncAttrs, DeclarativeBase):
     pass
 
 
+class Resource(Base):
+    __abstract__ = True
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(nullable=True, index=True)
+
+
+class Planet(Resource):
+    __tablename__ = 'swapi_planet'
+
+
+class Film(Resource):
+    __tablename__ = 'swapi_film'
+
+
+class Species(Resource):
+    __tablename__ = 'swapi_species'
+
+
+class Starship(Resource):
+    __tablename__ = 'swapi_starship'
+
+
+class Vehicle(Resource):
+    __tablename__ = 'swapi_vehicle'
+
+
 class People(Base):
-    __tablename__ = 'swapi_people'
+    __tablename__ = 'swapi_person'
 
     id: Mapped[int] = mapped_column(primary_key=True)
     birth_year: Mapped[str] = mapped_column(nullable=True)
     eye_color: Mapped[str] = mapped_column(nullable=True)
-    films: Mapped[str] = mapped_column(nullable=True)
     gender: Mapped[str] = mapped_column(nullable=True)
     hair_color: Mapped[str] = mapped_column(nullable=True)
     height: Mapped[str] = mapped_column(nullable=True)
-    homeworld: Mapped[str] = mapped_column(nullable=True)
+    homeworld_id: Mapped[int] = mapped_column(ForeignKey('swapi_planet.id'), nullable=True, index=True)
     mass: Mapped[str] = mapped_column(nullable=True)
     name: Mapped[str] = mapped_column(nullable=True)
     skin_color: Mapped[str] = mapped_column(nullable=True)
-    species: Mapped[str] = mapped_column(nullable=True)
-    starships: Mapped[str] = mapped_column(nullable=True)
-    vehicles: Mapped[str] = mapped_column(nullable=True)
+    edited: Mapped[str] = mapped_column(nullable=True)
+
+
+class PeopleLink(Base):
+    """
+    Связь персонажа со справочником. position - порядок ссылок в ответе API
+    """
+    __abstract__ = True
+
+    person_id: Mapped[int] = mapped_column(ForeignKey('swapi_person.id', ondelete='CASCADE'), primary_key=True)
+    position: Mapped[int] = mapped_column(primary_key=True)
+
+
+class PeopleFilm(PeopleLink):
+    __tablename__ = 'swapi_people_films'
+    __table_args__ = (Index('ix_swapi_people_films_film_id_person_id', 'film_id', 'person_id'),)
+
+    film_id: Mapped[int] = mapped_column(ForeignKey('swapi_film.id'))
+
+
+class PeopleSpecies(PeopleLink):
+    __tablename__ = 'swapi_people_species'
+    __table_args__ = (Index('ix_swapi_people_species_species_id_person_id', 'species_id', 'person_id'),)
+
+    species_id: Mapped[int] = mapped_column(ForeignKey('swapi_species.id'))
+
+
+class PeopleStarship(PeopleLink):
+    __tablename__ = 'swapi_people_starships'
+    __table_args__ = (Index('ix_swapi_people_starships_starship_id_person_id', 'starship_id', 'person_id'),)
+
+    starship_id: Mapped[int] = mapped_column(ForeignKey('swapi_starship.id'))
+
+
+class PeopleVehicle(PeopleLink):
+    __tablename__ = 'swapi_people_vehicles'
+    __table_args__ = (Index('ix_swapi_people_vehicles_vehicle_id_person_id', 'vehicle_id', 'person_id'),)
+
+    vehicle_id: Mapped[int] = mapped_column(ForeignKey('swapi_vehicle.id'))
+
+
+RESOURCE_MODELS = {'planets': Planet, 'films': Film, 'species': Species, 'starships': Starship, 'vehicles': Vehicle}
+# поле персонажа в API -> (таблица связей, колонка ссылки); справочник - RESOURCE_MODELS[поле]
+PEOPLE_LINKS = {'films': (PeopleFilm, 'film_id'),
+                'species': (PeopleSpecies, 'species_id'),
+                'starships': (PeopleStarship, 'starship_id'),
+                'vehicles': (PeopleVehicle, 'vehicle_id')}
+
+# представление с прежними плоскими колонками swapi_people: имена через запятую в порядке API
+PEOPLE_VIEW = 'swapi_people'
+people_view = table(PEOPLE_VIEW, column('id', Integer),
+                    *[column(name, String) for name in ('birth_year', 'eye_color', 'films', 'gender', 'hair_color',
+                                                        'height', 'homeworld', 'mass', 'name', 'skin_color',
+                                                        'species', 'starships', 'vehicles', 'edited')])
+
+
+class SyncCheckpoint(Base):
+    """
+    Чекпоинт инкрементальной загрузки ресурса: все страницы до last_page включительно записаны
+    """
+    __tablename__ = 'swapi_sync_checkpoint'
+
+    resource: Mapped[str] = mapped_column(primary_key=True)
+    last_page: Mapped[int] = mapped_column(default=0)
+    last_edited: Mapped[str] = mapped_column(nullable=True)
+    finished: Mapped[bool] = mapped_column(default=False)
+    synced_at: Mapped[datetime] = mapped_column(default=datetime.now)
+
+
+def upsert_query(model):
+    """
+    INSERT ... ON CONFLICT (первичный ключ) DO UPDATE только для изменившихся строк: неизменные не перезаписываются
+    """
+    insert = postgresql.insert if engine.dialect.name == 'postgresql' else sqlite.insert
+    query = insert(model)
+    table = model.__table__
+    values = {column.name: query.excluded[column.name] for column in table.columns if not column.primary_key}
+    changed = or_(*[table.c[name].is_distinct_from(value) for name, value in values.items()])
+    return query.on_conflict_do_update(index_elements=list(table.primary_key), set_=values, where=changed)
+
+
+def people_view_sql(dialect_name: str) -> str:
+    def names(field):
+        link, column = PEOPLE_LINKS[field]
+        resource = RESOURCE_MODELS[field].__tablename__
+        if dialect_name == 'postgresql':
+            aggregate = (f"SELECT string_agg(r.name, ',' ORDER BY l.position) FROM {link.__tablename__} l "
+                         f"JOIN {resource} r ON r.id = l.{column} WHERE l.person_id = p.id")
+        else:
+            # group_concat в SQLite склеивает в порядке строк подзапроса
+            aggregate = (f"SELECT group_concat(name, ',') FROM (SELECT r.name FROM {link.__tablename__} l "
+                         f"JOIN {resource} r ON r.id = l.{column} WHERE l.person_id = p.id ORDER BY l.position)")
+        return f"coalesce(({aggregate}), '') AS {field}"
+
+    return (f"CREATE VIEW {PEOPLE_VIEW} AS SELECT p.id, p.birth_year, p.eye_color, {names('films')}, "
+            f"p.gender, p.hair_color, p.height, h.name AS homeworld, p.mass, p.name, p.skin_color, "
+            f"{names('species')}, {names('starships')}, {names('vehicles')}, p.edited "
+            f"FROM {People.__tablename__} p LEFT JOIN {Planet.__tablename__} h ON h.id = p.homeworld_id")
+
+
+def create_people_view(connection):
+    inspector = inspect(connection)
+    if PEOPLE_VIEW in inspector.get_table_names():
+        # таблица swapi_people прежней схемы: данные перезагрузятся, инкрементальная загрузка начнется сначала
+        connection.execute(text(f'DROP TABLE {PEOPLE_VIEW}'))
+        connection.execute(SyncCheckpoint.__table__.delete())
+    if PEOPLE_VIEW not in inspector.get_view_names():
+        connection.execute(text(people_view_sql(connection.dialect.name)))
+
+
+def set_sqlite_pragmas(dbapi_connection, pragmas: dict):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+
+async def enable_bulk_pragmas(bulk_engine=engine, pragmas: dict = SQLITE_BULK_PRAGMAS):
+    """
+    PRAGMA на каждое новое соединение. Пул сбрасывается, чтобы уже открытые соединения не остались без них
+    """
+    if bulk_engine.dialect.name != 'sqlite':
+        return
+
+    def on_connect(dbapi_connection, connection_record):
+        set_sqlite_pragmas(dbapi_connection, pragmas)
+
+    event.listen(bulk_engine.sync_engine, 'connect', on_connect)
+    await bulk_engine.dispose()
 
 
-async def init_db():
+async def init_db(drop: bool = True):
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
+        if drop:
+            await conn.execute(text(f'DROP VIEW IF EXISTS {PEOPLE_VIEW}'))
+            await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_people_view)
@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+
+from aiohttp import web
+
+# число объектов каждого ресурса в настоящем SWAPI
+RESOURCES = {'people': 82, 'planets': 60, 'films': 6, 'species': 37, 'starships': 36, 'vehicles': 39}
+PAGE_SIZE = 10
+
+
+def resource_count(request: web.Request, resource: str) -> int:
+    return RESOURCES[resource] * request.app['scale']
+
+
+def object_url(request: web.Request, resource: str, object_id: int) -> str:
+    return f'{request.url.origin()}/api/{resource}/{object_id}/'
+
+
+def make_object(request: web.Request, resource: str, object_id: int) -> dict:
+    """
+    Синтетический объект ресурса. Ссылки персонажа детерминированы по id
+    """
+    data = {'url': object_url(request, resource, object_id),
+            'created': '2014-12-09T13:50:51.644000Z',
+            'edited': '2014-12-20T21:17:56.891000Z'}
+    if resource == 'films':
+        data['title'] = f'Film {object_id}'
+    else:
+        data['name'] = f'{resource.capitalize()} {object_id}'
+    if resource != 'people':
+        return data
+
+    def refs(ref_resource, *offsets):
+        count = resource_count(request, ref_resource)
+        return [object_url(request, ref_resource, (object_id + offset) % count + 1) for offset in offsets]
+
+    data.update({'birth_year': f'{object_id}BBY',
+                 'eye_color': 'blue',
+                 'gender': 'male' if object_id % 2 else 'female',
+                 'hair_color': 'blond',
+                 'height': str(150 + object_id % 50),
+                 'homeworld': refs('planets', 0)[0],
+                 'mass': str(50 + object_id % 50),
+                 'skin_color': 'fair',
+                 'films': refs('films', 0, 1, 2),
+                 'species': refs('species', 0),
+                 'starships': refs('starships', 0) if object_id % 3 == 0 else [],
+                 'vehicles': refs('vehicles', 0) if object_id % 4 == 0 else []})
+    return data
+
+
+def json_response(request: web.Request, data: dict) -> web.Response:
+    # ETag по телу и постоянный Last-Modified, как у swapi.dev: данные не меняются
+    body = json.dumps(data).encode()
+    etag = hashlib.md5(body).hexdigest()
+    if request.if_none_match and any(tag.value == etag for tag in request.if_none_match):
+        return web.Response(status=304, headers={'ETag': f'"{etag}"'})
+    response = web.Response(body=body, content_type='application/json')
+    response.etag = etag
+    response.last_modified = 1418937476
+    return response
+
+
+async def get_list(request: web.Request):
+    resource = request.match_info['resource']
+    if resource not in RESOURCES:
+        raise web.HTTPNotFound()
+    await asyncio.sleep(request.app['latency'])
+    count = resource_count(request, resource)
+    page = int(request.query.get('page', 1))
+    first_id = (page - 1) * PAGE_SIZE + 1
+    if first_id > count and page != 1:
+        raise web.HTTPNotFound()
+    last_id = min(count, first_id + PAGE_SIZE - 1)
+    next_url = None
+    if last_id < count:
+        next_url = str(request.url.update_query(page=page + 1))
+    return json_response(request, {'count': count,
+                                   'next': next_url,
+                                   'previous': str(request.url.update_query(page=page - 1)) if page > 1 else None,
+                                   'results': [make_object(request, resource, object_id)
+                                               for object_id in range(first_id, last_id + 1)]})
+
+
+async def get_object(request: web.Request):
+    resource = request.match_info['resource']
+    object_id = int(request.match_info['object_id'])
+    if resource not in RESOURCES or not 1 <= object_id <= resource_count(request, resource):
+        raise web.HTTPNotFound()
+    await asyncio.sleep(request.app['latency'])
+    return json_response(request, make_object(request, resource, object_id))
+
+
+@web.middleware
+async def inject_failures(request: web.Request, handler):
+    """
+    Случайные сбои: 503, 429 с Retry-After и зависшие ответы (дольше таймаута клиента)
+    """
+    app = request.app
+    roll = random.random()
+    if roll < app['error_rate']:
+        raise web.HTTPServiceUnavailable()
+    roll -= app['error_rate']
+    if roll < app['throttle_rate']:
+        raise web.HTTPTooManyRequests(headers={'Retry-After': str(app['retry_after'])})
+    roll -= app['throttle_rate']
+    if roll < app['hang_rate']:
+        await asyncio.sleep(app['hang_delay'])
+    return await handler(request)
+
+
+def make_app(scale: int = 1, latency: float = 0, error_rate: float = 0, throttle_rate: float = 0,
+             retry_after: int = 1, hang_rate: float = 0, hang_delay: float = 60) -> web.Application:
+    """
+    Локальная замена https://swapi.dev/api/ для проверки загрузчика без сети.
+    scale - во сколько раз больше объектов, чем в SWAPI, latency - задержка ответа в секундах,
+    *_rate - доли ответов 503, 429 и зависших ответов
+    """
+    app = web.Application(middlewares=[inject_failures])
+    app['scale'] = scale
+    app['latency'] = latency
+    app['error_rate'] = error_rate
+    app['throttle_rate'] = throttle_rate
+    app['retry_after'] = retry_after
+    app['hang_rate'] = hang_rate
+    app['hang_delay'] = hang_delay
+    app.add_routes([web.get('/api/{resource}/', get_list),
+                    web.get(r'/api/{resource}/{object_id:\d+}/', get_object)])
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--throttle-rate', type=float, default=0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--hang-rate', type=float, default=0)
+    parser.add_argument('--hang-delay', type=float, default=60)
+    args = parser.parse_args()
+    web.run_app(make_app(args.scale, args.latency, args.error_rate, args.throttle_rate,
+                         args.retry_after, args.hang_rate, args.hang_delay), port=args.port)
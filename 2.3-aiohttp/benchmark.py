@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+import aiohttp
+
+import serializer
+from schema import CreateSticker, PatchSticker
+from serializer import ObjectSerializer
+from validation import get_adapter
+
+BASE_URL = 'http://127.0.0.1:8080'
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def check_status(resp, expected=200):
+    # 401/404 вместо ответа - значит замеряется не то, что нужно
+    body = await resp.read()
+    if resp.status != expected:
+        raise RuntimeError(f'{resp.method} {resp.url}: {resp.status} {body[:200]!r}')
+    return body
+
+
+def print_latency(title, latency):
+    print(f'{title}: n={len(latency)} '
+          f'p50={percentile(latency, 50) * 1000:.1f}ms '
+          f'p99={percentile(latency, 99) * 1000:.1f}ms '
+          f'mean={statistics.mean(latency) * 1000:.1f}ms')
+
+
+async def get_sticker_latency(session, url, duration):
+    latency = []
+    stop_at = time.perf_counter() + duration
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        async with session.get(url) as resp:
+            await check_status(resp)
+        latency.append(time.perf_counter() - start)
+    return latency
+
+
+async def register_users(session, stop_event):
+    registered = 0
+    while not stop_event.is_set():
+        name = f'bench_{uuid.uuid4().hex[:12]}'
+        async with session.post(f'{BASE_URL}/user/', json={'name': name, 'password': 'password'}) as resp:
+            await check_status(resp)
+        registered += 1
+    return registered
+
+
+async def get_metrics(session):
+    async with session.get(f'{BASE_URL}/metrics') as resp:
+        return json.loads(await check_status(resp))
+
+
+async def bench_bcrypt(sticker_id, duration, registrations, username, password):
+    """
+    p99 GET /sticker/{id} без нагрузки и во время параллельных регистраций пользователей.
+    Все запросы с Basic auth: без нее middleware отвечает 401 и bcrypt не вызывается
+    """
+    url = f'{BASE_URL}/sticker/{sticker_id}'
+    async with aiohttp.ClientSession(auth=aiohttp.BasicAuth(username, password)) as session:
+        print_latency('GET sticker idle', await get_sticker_latency(session, url, duration))
+        completed = (await get_metrics(session))['bcrypt_executor']['completed']
+
+        stop_event = asyncio.Event()
+        writers = [asyncio.create_task(register_users(session, stop_event)) for _ in range(registrations)]
+        latency = await get_sticker_latency(session, url, duration)
+        stop_event.set()
+        registered = sum(await asyncio.gather(*writers))
+        print_latency(f'GET sticker with {registrations} registrations', latency)
+
+        metrics = await get_metrics(session)
+        hashed = metrics['bcrypt_executor']['completed'] - completed
+        print(f'registered={registered} bcrypt_completed={hashed}')
+        if registered and hashed < registered:
+            raise RuntimeError('Регистрации не дошли до bcrypt')
+        print(metrics)
+
+
+def make_stickers(count):
+    now = datetime.now()
+    return [SimpleNamespace(id=number, title=f'title{number}', description=f'description{number}' * 5,
+                            owner_id=number % 100, create_datetime=now) for number in range(count)]
+
+
+def dumps_stickers_stdlib(stickers):
+    # прежний путь: словарь вручную, isoformat() и стандартный json
+    return json.dumps([{'id': instance.id, 'name': instance.title, 'description': instance.description,
+                        'owner_id': instance.owner_id, 'create_datetime': instance.create_datetime.isoformat()}
+                       for instance in stickers]).encode()
+
+
+def bench_serialization(repeat_objects=100000):
+    """
+    Пропускная способность сериализации 1, 100 и 10 000 объявлений: прежний путь против ObjectSerializer
+    """
+    sticker_serializer = ObjectSerializer({'id': 'id', 'name': 'title', 'description': 'description',
+                                           'owner_id': 'owner_id', 'create_datetime': 'create_datetime'})
+    orjson = serializer.orjson
+    cases = [('stdlib', dumps_stickers_stdlib, None), ('serializer[json]', sticker_serializer.dumps_many, None)]
+    if orjson is not None:
+        cases.append(('serializer[orjson]', sticker_serializer.dumps_many, orjson))
+    for count in (1, 100, 10000):
+        stickers = make_stickers(count)
+        rounds = max(1, repeat_objects // count)
+        for title, dumps_many, backend in cases:
+            serializer.orjson = backend
+            start = time.perf_counter()
+            for _ in range(rounds):
+                dumps_many(stickers)
+            duration = time.perf_counter() - start
+            print(f'{count:>6} stickers {title:<20} {rounds * count / duration:>12.0f} objects/s')
+    serializer.orjson = orjson
+
+
+def bench_validation(rounds=100000):
+    """
+    Валидация тела запроса: json.loads + model_validate + model_dump против закэшированного валидатора из байтов
+    """
+    payloads = [(CreateSticker, b'{"title": "title", "description": "description", "owner_id": 1}'),
+                (PatchSticker, b'{"title": "new title"}')]
+    for model, payload in payloads:
+        adapter = get_adapter(model)
+        cases = [('model_validate', lambda: model.model_validate(json.loads(payload)).model_dump(exclude_unset=True)),
+                 ('adapter.validate_json', lambda: adapter.validate_json(payload))]
+        for title, validate in cases:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                validate()
+            duration = time.perf_counter() - start
+            print(f'{model.__name__:<14} {title:<22} {rounds / duration:>12.0f} payloads/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sticker-id', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--registrations', type=int, default=8)
+    parser.add_argument('--user', default='user1', help='пользователь для Basic auth')
+    parser.add_argument('--password', default='user1')
+    parser.add_argument('--serialization', action='store_true', help='микробенчмарк сериализации, сервер не нужен')
+    parser.add_argument('--validation', action='store_true', help='микробенчмарк валидации, сервер не нужен')
+    args = parser.parse_args()
+    if args.serialization:
+        bench_serialization()
+    elif args.validation:
+        bench_validation()
+    else:
+        asyncio.run(bench_bcrypt(args.sticker_id, args.duration, args.registrations, args.user, args.password))
@@ -0,0 +1,77 @@
+import hashlib
+import hmac
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class CredentialsCache:
+    """
+    Кэш проверенных учетных данных: (username, digest пароля) -> user_id.
+    Размер ограничен (вытесняется самая давняя запись), записи устаревают через ttl секунд.
+    Пароль в открытом виде не хранится - только HMAC с ключом, случайным для процесса.
+    generation() берется до чтения пароля из БД и передается в set(): если пользователя сбросили
+    после чтения, проверенный старый пароль не кэшируется
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._key = os.urandom(32)
+        self._items = OrderedDict()
+        # user_id -> номер последнего сброса; старые номера вытесняются, _pruned - наибольший вытесненный
+        self._counter = 0
+        self._invalidated = OrderedDict()
+        self._pruned = 0
+
+    def _make_key(self, username: str, password: str) -> tuple:
+        return username, hmac.new(self._key, password.encode(), hashlib.sha256).digest()
+
+    def get(self, username: str, password: str) -> Optional[int]:
+        key = self._make_key(username, password)
+        item = self._items.get(key)
+        if item is not None:
+            user_id, expire_at = item
+            if expire_at > time.monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return user_id
+            del self._items[key]
+        self.misses += 1
+        return None
+
+    def generation(self) -> int:
+        return self._counter
+
+    def set(self, username: str, password: str, user_id: int, generation: int = None):
+        if self.max_size <= 0:
+            return
+        if generation is not None and self._invalidated.get(user_id, self._pruned) > generation:
+            return
+        key = self._make_key(username, password)
+        self._items[key] = (user_id, time.monotonic() + self.ttl)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        for key in [key for key, (item_user_id, _) in self._items.items() if item_user_id == user_id]:
+            del self._items[key]
+        self._counter += 1
+        self._invalidated[user_id] = self._counter
+        self._invalidated.move_to_end(user_id)
+        while len(self._invalidated) > max(self.max_size, 1):
+            self._pruned = max(self._pruned, self._invalidated.popitem(last=False)[1])
+
+    def clear(self):
+        self._items.clear()
+        self._counter += 1
+        self._invalidated.clear()
+        self._pruned = self._counter
+
+    def stats(self) -> dict:
+        return {'size': len(self._items), 'max_size': self.max_size, 'ttl': self.ttl,
+                'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,76 @@
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+
+def _hash_password(password: bytes) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt())
+
+
+def _check_password(password: bytes, hashed_password: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed_password)
+
+
+class BcryptExecutor:
+    """
+    Выполняет bcrypt в пуле потоков или процессов, чтобы не блокировать event loop.
+    Одновременно в пуле не больше max_concurrency задач, остальные ждут в очереди.
+    """
+
+    def __init__(self, kind: str = 'thread', max_workers: Optional[int] = None,
+                 max_concurrency: Optional[int] = None):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f'Неизвестный тип пула: {kind}')
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency or max_workers or 4
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.max_queue_depth = 0
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='bcrypt')
+        return self._executor
+
+    async def run(self, func, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def hash_password(self, password: str) -> str:
+        return (await self.run(_hash_password, password.encode())).decode()
+
+    async def check_password(self, password: str, hashed_password: str) -> bool:
+        return await self.run(_check_password, password.encode(), hashed_password.encode())
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._semaphore = None
+
+    def stats(self) -> dict:
+        return {'kind': self.kind, 'max_concurrency': self.max_concurrency, 'queued': self.queued,
+                'running': self.running, 'completed': self.completed, 'max_queue_depth': self.max_queue_depth}
@@ -4,10 +4,14 @@ from typing import List
 
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Text, DateTime, ForeignKey, func
+from sqlalchemy import String, Text, DateTime, ForeignKey, Index, func, inspect, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from dotenv import load_dotenv
 
+from pool_metrics import PoolMetrics, metered_pool_class
+
 load_dotenv()
 
 DB_HOST = os.environ.get('DB_HOST')
@@ -16,12 +20,28 @@ DB_NAME = os.environ.get('DB_NAME')
 DB_USER = os.environ.get('DB_USER')
 DB_PASSWORD = os.environ.get('DB_PASSWORD')
 
-DB_DSN = f'postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+DB_DSN = os.environ.get('DB_DSN') or f'postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', -1))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'false').lower() in ('1', 'true', 'yes')
 
-engine = create_async_engine(DB_DSN)
+pool_metrics = PoolMetrics()
+engine = create_async_engine(DB_DSN, poolclass=metered_pool_class(AsyncAdaptedQueuePool, pool_metrics),
+                             pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_recycle=DB_POOL_RECYCLE,
+                             pool_timeout=DB_POOL_TIMEOUT, pool_pre_ping=DB_POOL_PRE_PING)
 Session = async_sessionmaker(engine, expire_on_commit=False)
 
 
+# в SQLite даты - строки, server_default=func.now() пишет их без микросекунд. Параметры пишутся так же,
+# иначе курсор '... 12:00:00.000000' больше хранимого '... 12:00:00' и сравнение по (create_datetime, id) неверно
+SQLITE_DATETIME = sqlite.DATETIME(storage_format='%(year)04d-%(month)02d-%(day)02d '
+                                                 '%(hour)02d:%(minute)02d:%(second)02d')
+CreateDateTime = DateTime().with_variant(SQLITE_DATETIME, 'sqlite')
+
+
 class Base(AsyncAttrs, DeclarativeBase):
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -31,20 +51,48 @@ class User(Base):
 
     name: Mapped[str] = mapped_column(String[50], unique=True, index=True, nullable=False)
     password: Mapped[str] = mapped_column(String[255], nullable=False)
-    create_datetime: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    create_datetime: Mapped[datetime] = mapped_column(CreateDateTime, server_default=func.now())
+    version: Mapped[int] = mapped_column(nullable=False, server_default='1')
     stickers: Mapped[List["Sticker"]] = relationship(back_populates="owner")
 
+    __mapper_args__ = {'version_id_col': version}
+
 
 class Sticker(Base):
     __tablename__ = 'fl_sticker'
 
     title: Mapped[str] = mapped_column(String[255], index=True, nullable=False)
     description: Mapped[str] = mapped_column(Text, nullable=False)
-    create_datetime: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    create_datetime: Mapped[datetime] = mapped_column(CreateDateTime, server_default=func.now())
+    version: Mapped[int] = mapped_column(nullable=False, server_default='1')
     owner_id: Mapped[int] = mapped_column(ForeignKey("fl_user.id"))
     owner: Mapped["User"] = relationship(back_populates="stickers")
 
+    __mapper_args__ = {'version_id_col': version}
+    __table_args__ = (Index('ix_fl_sticker_create_datetime_id', 'create_datetime', 'id'),
+                      Index('ix_fl_sticker_owner_id_create_datetime_id', 'owner_id', 'create_datetime', 'id'),
+                      # title LIKE 'prefix%': при collation не "C" обычный btree PostgreSQL для префикса не подходит
+                      Index('ix_fl_sticker_title_pattern', 'title',
+                            postgresql_ops={'title': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'))
+
+
+def add_version_columns(connection):
+    # create_all не добавляет колонки в уже существующие таблицы, старые строки получают версию 1
+    inspector = inspect(connection)
+    for model in (User, Sticker):
+        columns = {column['name'] for column in inspector.get_columns(model.__tablename__)}
+        if 'version' not in columns:
+            connection.execute(text(f'ALTER TABLE {model.__tablename__} ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
+
+
+def create_indexes(connection):
+    # create_all не добавляет индексы в уже существующие таблицы
+    for index in Sticker.__table__.indexes:
+        index.create(bind=connection, checkfirst=True)
+
 
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_version_columns)
+        await conn.run_sync(create_indexes)
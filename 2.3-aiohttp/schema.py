@@ -37,3 +37,10 @@ class CreateSticker(pydantic.BaseModel):
 class PatchSticker(CreateSticker):
     title: Optional[str] = None
     description: Optional[str] = None
+
+
+class ListSticker(pydantic.BaseModel):
+    owner_id: Optional[int] = None
+    title: Optional[str] = None
+    cursor: Optional[str] = None
+    limit: Optional[int] = pydantic.Field(None, ge=1)
@@ -0,0 +1,49 @@
+import json
+import operator
+from datetime import date, datetime
+from typing import Iterable
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(data) -> bytes:
+    """
+    Сериализация в JSON: orjson, если установлен, иначе стандартный json.
+    datetime в обоих случаях выводится в ISO 8601
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class ObjectSerializer:
+    """
+    Сериализатор объектов модели: поля ответа -> атрибуты объекта.
+    Атрибуты читаются одним заранее собранным attrgetter, подходит и для ORM-объектов, и для строк select()
+    """
+
+    def __init__(self, fields: dict):
+        self.names = tuple(fields)
+        getter = operator.attrgetter(*fields.values())
+        if len(fields) == 1:
+            self._values = lambda instance: (getter(instance),)
+        else:
+            self._values = getter
+
+    def to_dict(self, instance) -> dict:
+        return dict(zip(self.names, self._values(instance)))
+
+    def dumps(self, instance) -> bytes:
+        return dumps(self.to_dict(instance))
+
+    def dumps_many(self, instances: Iterable) -> bytes:
+        return dumps([self.to_dict(instance) for instance in instances])
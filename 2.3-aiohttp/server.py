@@ -1,28 +1,58 @@
+import base64
 import json
+import os
+from datetime import datetime
 from typing import Type
 
-from aiohttp import web
+from aiohttp import web, ETag
 from aiohttp_basicauth import BasicAuthMiddleware
-import bcrypt
 from pydantic import ValidationError
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, delete, bindparam, tuple_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 
-from models import User, Sticker, Session, init_db, engine
-from schema import DefaultValidateSchema, CreateUser, PatchUser, CreateSticker, PatchSticker
+from models import User, Sticker, Session, init_db, engine, pool_metrics
+from validation import get_adapter
+from schema import DefaultValidateSchema, CreateUser, PatchUser, CreateSticker, PatchSticker, ListSticker
+from cache import CredentialsCache
+from hashing import BcryptExecutor
+from serializer import ObjectSerializer, dumps
+
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 1024))
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', 300))
+
+BCRYPT_EXECUTOR = os.environ.get('BCRYPT_EXECUTOR', 'thread')
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', 0)) or None
+BCRYPT_MAX_CONCURRENCY = int(os.environ.get('BCRYPT_MAX_CONCURRENCY', 0)) or None
+LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', 50))
+LIST_MAX_PAGE_SIZE = int(os.environ.get('LIST_MAX_PAGE_SIZE', 1000))
+LIST_YIELD_PER = int(os.environ.get('LIST_YIELD_PER', 100))
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 100))
+
+credentials_cache = CredentialsCache(max_size=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+bcrypt_executor = BcryptExecutor(kind=BCRYPT_EXECUTOR, max_workers=BCRYPT_WORKERS,
+                                 max_concurrency=BCRYPT_MAX_CONCURRENCY)
 
 
 class CustomBasicAuth(BasicAuthMiddleware):
     async def check_credentials(self, username, password, request):
-        async with Session() as session:
-            query_result = await session.execute(select(User).where(User.name == username).limit(1))
-            if not query_result.closed:
-                user = query_result.scalar()
-        if not user or not check_password(password, user.password):
+        user_id = credentials_cache.get(username, password)
+        if user_id is not None:
+            request.user_id = user_id
+            return True
+
+        # поколение до чтения: смена пароля, закоммиченная во время bcrypt, не даст закэшировать старый
+        generation = credentials_cache.generation()
+        # сессия запроса уже открыта в session_middleware и дальше используется обработчиком
+        query = select(User.id, User.password).where(User.name == username).limit(1)
+        query_result = await request.session.execute(query)
+        user = query_result.first()
+        if not user or not await check_password(password, user.password):
             request.user_id = None
             return False
 
         request.user_id = user.id
+        credentials_cache.set(username, password, user.id, generation)
         return True
 
 
@@ -37,13 +67,18 @@ async def orm_context(app: web.Application):
         if not query_result.closed:
             user = query_result.scalar()
         if not user:
-            user = User(name='user1', password=hash_password('user1'))
+            user = User(name='user1', password=await hash_password('user1'))
             session.add(user)
             await session.commit()
     yield
     await engine.dispose()
 
 
+async def executor_context(app: web.Application):
+    yield
+    bcrypt_executor.shutdown()
+
+
 @web.middleware
 async def session_middleware(request: web.Request, handler):
     async with Session() as session:
@@ -52,33 +87,84 @@ async def session_middleware(request: web.Request, handler):
         return response
 
 
+async def metrics(request: web.Request):
+    return web.json_response({'auth_cache': credentials_cache.stats(), 'bcrypt_executor': bcrypt_executor.stats(),
+                              'db_pool': pool_metrics.stats(engine.sync_engine.pool)})
+
+
+app.cleanup_ctx.append(executor_context)
 app.cleanup_ctx.append(orm_context)
-app.middlewares.append(auth)
 app.middlewares.append(session_middleware)
+app.middlewares.append(auth)
 
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+async def hash_password(password: str) -> str:
+    return await bcrypt_executor.hash_password(password)
 
 
-def check_password(password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed_password.encode())
+async def check_password(password: str, hashed_password: str) -> bool:
+    return await bcrypt_executor.check_password(password, hashed_password)
 
 
 def get_http_error(error_class: Type[web.HTTPClientError], message: str):
     return error_class(text=json.dumps({'error': message}), content_type='application/json')
 
 
+def json_response(data, status: int = 200) -> web.Response:
+    return web.Response(body=dumps(data), status=status, content_type='application/json')
+
+
+def make_etag(object_id: int, version: int) -> ETag:
+    return ETag(value=f'{object_id}-{version}', is_weak=True)
+
+
+def etag_matches(etags, etag: ETag) -> bool:
+    return any(item.value in (etag.value, '*') for item in etags)
+
+
+def encode_cursor(create_datetime: datetime, object_id: int) -> str:
+    return base64.urlsafe_b64encode(f'{create_datetime.isoformat()}|{object_id}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        create_datetime, object_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(create_datetime), int(object_id)
+    except ValueError:
+        raise get_http_error(web.HTTPBadRequest, f'Некорректный курсор {cursor}')
+
+
+def validation_error(err: ValidationError):
+    error = err.errors()[0]
+    error.pop('ctx', None)
+    if isinstance(error.get('input'), bytes):
+        # при невалидном JSON input - сырое тело запроса
+        error.pop('input')
+    return get_http_error(web.HTTPBadRequest, error)
+
+
 def validate(model, data):
     try:
-        return model.model_validate(data).model_dump(exclude_unset=True)
+        return get_adapter(model).validate_python(data)
     except ValidationError as err:
-        error = err.errors()[0]
-        error.pop('ctx', None)
-        raise get_http_error(web.HTTPBadRequest, error)
+        raise validation_error(err)
+
+
+def validate_json(model, data: bytes):
+    # тело запроса проверяется без отдельного разбора JSON
+    try:
+        return get_adapter(model).validate_json(data)
+    except ValidationError as err:
+        raise validation_error(err)
+
+
+def batch_error(index: int, error: web.HTTPException) -> dict:
+    return {'index': index, 'status': error.status, 'error': json.loads(error.text)['error']}
 
 
 class ObjectView(web.View):
+    serializer: ObjectSerializer = None
+
     @property
     def session(self) -> Session:
         return self.request.session
@@ -99,8 +185,34 @@ class ObjectView(web.View):
             raise get_http_error(web.HTTPNotFound, f'{desc} [id={object_id}] не найден')
         return obj
 
+    async def get_object_version(self, object_id) -> int:
+        model = self.object_model()
+        version = await self.session.scalar(select(model.version).where(model.id == object_id))
+        if version is None:
+            desc = self.object_description()
+            if not desc:
+                desc = self.__name__
+            raise get_http_error(web.HTTPNotFound, f'{desc} [id={object_id}] не найден')
+        return version
+
+    def check_if_match(self, obj):
+        if_match = self.request.if_match
+        if if_match and not etag_matches(if_match, make_etag(obj.id, obj.version)):
+            desc = self.object_description()
+            if not desc:
+                desc = self.__name__
+            raise get_http_error(web.HTTPPreconditionFailed, f'{desc} [id={obj.id}] был изменен')
+
+    def object_to_dict(self, instance) -> dict:
+        return self.serializer.to_dict(instance)
+
     def get_object_json_response(self, instance):
-        return None
+        return web.Response(body=self.serializer.dumps(instance), content_type='application/json')
+
+    def get_object_response(self, instance):
+        response = self.get_object_json_response(instance)
+        response.etag = make_etag(instance.id, instance.version)
+        return response
 
     async def commit_object(self, instance):
         try:
@@ -111,17 +223,71 @@ class ObjectView(web.View):
             if not desc:
                 desc = self.__name__
             raise get_http_error(web.HTTPBadRequest, f'{desc} уже существует')
+        except StaleDataError:
+            await self.session.rollback()
+            desc = self.object_description()
+            if not desc:
+                desc = self.__name__
+            raise get_http_error(web.HTTPPreconditionFailed, f'{desc} [id={instance.id}] был изменен')
         return instance
 
+    def list_query(self, params: dict, cursor: tuple = None):
+        return None
+
+    async def get_list(self):
+        list_shema = self.validate_shema().get('list')
+        if list_shema is None:
+            raise get_http_error(web.HTTPBadRequest, 'Получение списка не поддерживается')
+        params = validate(list_shema, dict(self.request.query))
+        limit = min(params.get('limit', LIST_PAGE_SIZE), LIST_MAX_PAGE_SIZE)
+        cursor = decode_cursor(params['cursor']) if params.get('cursor') else None
+        query = self.list_query(params, cursor).limit(limit + 1)
+
+        # строки читаются порциями по LIST_YIELD_PER, страница целиком в памяти не собирается.
+        # Запрос открывается до prepare(): ошибка БД вернется обычным ответом с ошибкой, а не обрезанным 200
+        result = await self.session.stream(query.execution_options(yield_per=LIST_YIELD_PER))
+        try:
+            response = web.StreamResponse(headers={'Content-Type': 'application/json'})
+            await response.prepare(self.request)
+            await response.write(b'{"items": [')
+            next_cursor = None
+            last_row = None
+            count = 0
+            async for row in result:
+                if count == limit:
+                    next_cursor = encode_cursor(last_row.create_datetime, last_row.id)
+                    break
+                if count:
+                    await response.write(b', ')
+                await response.write(self.serializer.dumps(row))
+                last_row = row
+                count += 1
+        finally:
+            await result.close()
+        await response.write(b'], "next_cursor": ' + dumps(next_cursor) + b'}')
+        await response.write_eof()
+        return response
+
     async def get(self):
+        if self.request.match_info.get('object_id') is None:
+            return await self.get_list()
         object_id = int(self.request.match_info.get('object_id'))
+        if_none_match = self.request.if_none_match
+        if if_none_match:
+            etag = make_etag(object_id, await self.get_object_version(object_id))
+            if etag_matches(if_none_match, etag):
+                response = web.Response(status=304)
+                response.etag = etag
+                return response
         obj = await self.get_object(object_id)
-        return self.get_object_json_response(obj)
+        return self.get_object_response(obj)
+
+    shemas = {'post': DefaultValidateSchema, 'patch': DefaultValidateSchema}
 
     def validate_shema(self) -> dict:
-        return {'post': DefaultValidateSchema, 'patch': DefaultValidateSchema}
+        return self.shemas
 
-    def post_after_validate(self, data):
+    async def post_after_validate(self, data):
         return data
 
     def post_after_create(self, obj):
@@ -129,68 +295,253 @@ class ObjectView(web.View):
 
     # @auth.required
     async def post(self):
-        object_data = validate(self.validate_shema()['post'], await self.request.json())
-        object_data = self.post_after_validate(object_data)
+        object_data = validate_json(self.validate_shema()['post'], await self.request.read())
+        object_data = await self.post_after_validate(object_data)
         model_class = self.object_model()
         new_object = model_class(**object_data)
         new_object = self.post_after_create(new_object)
         await self.commit_object(new_object)
-        return self.get_object_json_response(new_object)
+        return self.get_object_response(new_object)
 
-    def patch_after_validate(self, data):
+    async def patch_after_validate(self, data):
         return data
 
     def before_patch(self, obj):
         return obj
 
+    def after_patch(self, object_id, data):
+        pass
+
+    def owner_column(self):
+        return None
+
+    def owned_object_filter(self, query, object_id):
+        model = self.object_model()
+        query = query.where(model.id == object_id)
+        owner = self.owner_column()
+        if owner is not None:
+            query = query.where(owner == self.request.user_id)
+        versions = self.if_match_versions(object_id)
+        if versions is not None:
+            query = query.where(model.version.in_(versions))
+        return query
+
+    def if_match_versions(self, object_id):
+        if_match = self.request.if_match
+        if not if_match or any(etag.value == '*' for etag in if_match):
+            return None
+        versions = []
+        for etag in if_match:
+            etag_object_id, _, version = etag.value.partition('-')
+            if etag_object_id == str(object_id) and version.isdigit():
+                versions.append(int(version))
+        return versions
+
+    async def raise_not_changed(self, object_id, check_access):
+        # условный запрос не затронул ни одной строки - выясняем причину: 404, 403 или 412
+        obj = await self.get_object(object_id)
+        check_access(obj)
+        self.check_if_match(obj)
+        desc = self.object_description()
+        if not desc:
+            desc = self.__name__
+        raise get_http_error(web.HTTPConflict, f'{desc} [id={object_id}] был изменен')
+
     @auth.required
     async def patch(self):
         object_id = int(self.request.match_info.get('object_id'))
-        object_data = validate(self.validate_shema()['patch'], await self.request.json())
-        object_data = self.patch_after_validate(object_data)
-        obj = await self.get_object(object_id)
-        obj = self.before_patch(obj)
-        for key, value in object_data.items():
-            setattr(obj, key, value)
-        await self.commit_object(obj)
-        return self.get_object_json_response(obj)
+        object_data = validate_json(self.validate_shema()['patch'], await self.request.read())
+        object_data = await self.patch_after_validate(object_data)
+        model = self.object_model()
+        query = self.owned_object_filter(update(model), object_id)
+        query = query.values(**object_data, version=model.version + 1).returning(model)
+        try:
+            obj = (await self.session.scalars(query.execution_options(populate_existing=True))).one_or_none()
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            desc = self.object_description()
+            if not desc:
+                desc = self.__name__
+            raise get_http_error(web.HTTPBadRequest, f'{desc} уже существует')
+        if obj is None:
+            await self.raise_not_changed(object_id, self.before_patch)
+        self.after_patch(object_id, object_data)
+        return self.get_object_response(obj)
 
     def before_delete(self, data):
         return data
 
+    def after_delete(self, object_id):
+        pass
+
     @auth.required
     async def delete(self):
         object_id = int(self.request.match_info.get('object_id'))
-        obj = await self.get_object(object_id)
-        obj = self.before_delete(obj)
-        await self.session.delete(obj)
+        model = self.object_model()
+        query = self.owned_object_filter(delete(model), object_id)
+        deleted_id = (await self.session.scalars(query.returning(model.id))).one_or_none()
         await self.session.commit()
+        if deleted_id is None:
+            await self.raise_not_changed(object_id, self.before_delete)
+        self.after_delete(object_id)
         return web.json_response({'status': 'ok'})
 
 
+class ObjectBatchView(ObjectView):
+    """
+    Пакетные операции: тело запроса - список объектов (для DELETE - список id).
+    Ошибки валидации и доступа возвращаются по каждому элементу, запись в БД - одним запросом на пакет.
+    """
+
+    async def get_batch(self) -> list:
+        try:
+            items = await self.request.json()
+        except ValueError:
+            raise get_http_error(web.HTTPBadRequest, 'Некорректный JSON')
+        if not isinstance(items, list):
+            raise get_http_error(web.HTTPBadRequest, 'Ожидается список объектов')
+        if len(items) > BATCH_MAX_SIZE:
+            raise get_http_error(web.HTTPBadRequest, f'Максимальный размер пакета {BATCH_MAX_SIZE}')
+        return items
+
+    async def get_batch_objects(self, object_ids) -> dict:
+        model = self.object_model()
+        query = select(model).where(model.id.in_(set(object_ids))).with_for_update()
+        return {obj.id: obj for obj in await self.session.scalars(query)}
+
+    def check_batch_object(self, objects: dict, object_id):
+        obj = objects.get(object_id)
+        if obj is None:
+            desc = self.object_description()
+            if not desc:
+                desc = self.__name__
+            raise get_http_error(web.HTTPNotFound, f'{desc} [id={object_id}] не найден')
+        return obj
+
+    async def execute_batch(self, statements: list) -> list:
+        try:
+            results = []
+            for statement, rows in statements:
+                result = await self.session.execute(statement, rows)
+                results.append(result.all() if result.returns_rows else None)
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            raise get_http_error(web.HTTPBadRequest, 'Ошибка записи пакета')
+        return results
+
+    @auth.required
+    async def post(self):
+        items = await self.get_batch()
+        results = [None] * len(items)
+        model_class = self.object_model()
+        table = model_class.__table__
+        indexes, rows = [], []
+        for index, item in enumerate(items):
+            try:
+                object_data = await self.post_after_validate(validate(self.validate_shema()['post'], item))
+            except web.HTTPException as err:
+                results[index] = batch_error(index, err)
+                continue
+            new_object = self.post_after_create(model_class(**object_data))
+            row = {column.key: getattr(new_object, column.key) for column in table.columns
+                   if getattr(new_object, column.key) is not None}
+            row['version'] = 1
+            indexes.append(index)
+            rows.append(row)
+        if rows:
+            statement = insert(table).returning(*table.columns, sort_by_parameter_order=True)
+            new_rows, = await self.execute_batch([(statement, rows)])
+            for index, new_row in zip(indexes, new_rows):
+                results[index] = {'index': index, 'status': web.HTTPCreated.status_code,
+                                  'object': self.object_to_dict(new_row)}
+        return json_response({'items': results})
+
+    @auth.required
+    async def patch(self):
+        items = await self.get_batch()
+        results = [None] * len(items)
+        updates = {}
+        for index, item in enumerate(items):
+            try:
+                object_id = item.get('id') if isinstance(item, dict) else None
+                if not isinstance(object_id, int):
+                    raise get_http_error(web.HTTPBadRequest, 'Не указан id объекта')
+                object_data = await self.patch_after_validate(validate(self.validate_shema()['patch'], item))
+                object_data.pop('id', None)
+                updates[index] = object_id, object_data
+            except web.HTTPException as err:
+                results[index] = batch_error(index, err)
+
+        objects = await self.get_batch_objects(object_id for object_id, _ in updates.values())
+        groups = {}
+        for index, (object_id, object_data) in updates.items():
+            try:
+                self.before_patch(self.check_batch_object(objects, object_id))
+            except web.HTTPException as err:
+                results[index] = batch_error(index, err)
+                continue
+            groups.setdefault(tuple(sorted(object_data)), []).append({'_id': object_id, **object_data})
+            results[index] = {'index': index, 'status': web.HTTPOk.status_code, 'id': object_id}
+
+        # один executemany на каждый набор изменяемых полей, все в одной транзакции
+        table = self.object_model().__table__
+        statement = update(table).where(table.c.id == bindparam('_id')).values(version=table.c.version + 1)
+        await self.execute_batch([(statement, rows) for rows in groups.values()])
+        for rows in groups.values():
+            for row in rows:
+                self.after_patch(row['_id'], row)
+        return json_response({'items': results})
+
+    @auth.required
+    async def delete(self):
+        items = await self.get_batch()
+        results = [None] * len(items)
+        objects = await self.get_batch_objects(item for item in items if isinstance(item, int))
+        object_ids = []
+        for index, object_id in enumerate(items):
+            try:
+                if not isinstance(object_id, int):
+                    raise get_http_error(web.HTTPBadRequest, 'Не указан id объекта')
+                self.before_delete(self.check_batch_object(objects, object_id))
+            except web.HTTPException as err:
+                results[index] = batch_error(index, err)
+                continue
+            object_ids.append(object_id)
+            results[index] = {'index': index, 'status': web.HTTPOk.status_code, 'id': object_id}
+        if object_ids:
+            table = self.object_model().__table__
+            await self.execute_batch([(delete(table).where(table.c.id.in_(object_ids)), None)])
+            for object_id in object_ids:
+                self.after_delete(object_id)
+        return json_response({'items': results})
+
+
 class UserView(ObjectView):
+    shemas = {'post': CreateUser, 'patch': PatchUser}
+    serializer = ObjectSerializer({'id': 'id', 'name': 'name', 'create_datetime': 'create_datetime'})
+
     def object_description(self) -> str:
         return 'Пользователь'
 
     def object_model(self):
         return User
 
-    def get_object_json_response(self, instance):
-        return web.json_response(
-            {'id': instance.id, 'name': instance.name, 'create_datetime': instance.create_datetime.isoformat()})
-
-    def validate_shema(self) -> dict:
-        return {'post': CreateUser, 'patch': PatchUser}
-
-    def post_after_validate(self, data):
-        data['password'] = hash_password(data['password'])
+    async def post_after_validate(self, data):
+        data['password'] = await hash_password(data['password'])
         return data
 
-    def patch_after_validate(self, data):
+    async def patch_after_validate(self, data):
         if 'password' in data:
-            data['password'] = hash_password(data['password'])
+            data['password'] = await hash_password(data['password'])
         return data
 
+    def after_patch(self, object_id, data):
+        # после коммита: до него параллельная проверка могла бы снова закэшировать старый пароль
+        if 'password' in data or 'name' in data:
+            credentials_cache.invalidate_user(object_id)
+
     def check_user_access(self, object_id, user_id, action_text):
         if user_id != self.request.user_id:
             raise get_http_error(web.HTTPForbidden,
@@ -205,27 +556,40 @@ class UserView(ObjectView):
         self.check_user_access(data.id, data.id, 'удалить')
         return data
 
+    def owner_column(self):
+        return User.id
+
+    def after_delete(self, object_id):
+        credentials_cache.invalidate_user(object_id)
+
 
 class StickerView(ObjectView):
+    shemas = {'post': CreateSticker, 'patch': PatchSticker, 'list': ListSticker}
+    serializer = ObjectSerializer({'id': 'id', 'name': 'title', 'description': 'description', 'owner_id': 'owner_id',
+                                   'create_datetime': 'create_datetime'})
+
     def object_description(self) -> str:
         return 'Объявление'
 
     def object_model(self):
         return Sticker
 
-    def get_object_json_response(self, instance):
-        return web.json_response({'id': instance.id, 'name': instance.title, 'description': instance.description,
-                                  'owner_id': instance.owner_id,
-                                  'create_datetime': instance.create_datetime.isoformat()})
-
-    def validate_shema(self) -> dict:
-        return {'post': CreateSticker, 'patch': PatchSticker}
+    def list_query(self, params: dict, cursor: tuple = None):
+        query = select(Sticker.id, Sticker.title, Sticker.description, Sticker.owner_id, Sticker.create_datetime)
+        if params.get('owner_id') is not None:
+            query = query.where(Sticker.owner_id == params['owner_id'])
+        if params.get('title'):
+            query = query.where(Sticker.title.startswith(params['title'], autoescape=True))
+        if cursor is not None:
+            query = query.where(tuple_(Sticker.create_datetime, Sticker.id) <
+                                 tuple_(*cursor, types=[Sticker.create_datetime.type, Sticker.id.type]))
+        return query.order_by(Sticker.create_datetime.desc(), Sticker.id.desc())
 
     def post_after_create(self, obj):
         obj.owner_id = self.request.user_id
         return obj
 
-    def patch_after_validate(self, data):
+    async def patch_after_validate(self, data):
         if 'owner_id' in data:
             del data['owner_id']
         return data
@@ -244,11 +608,21 @@ class StickerView(ObjectView):
         self.check_owner_access(data.id, data.owner_id, 'удалить')
         return data
 
+    def owner_column(self):
+        return Sticker.owner_id
+
+
+class StickerBatchView(ObjectBatchView, StickerView):
+    pass
+
 
 app.add_routes([web.get('/user/{object_id:\d+}', UserView), web.patch('/user/{object_id:\d+}', UserView),
                 web.delete('/user/{object_id:\d+}', UserView), web.post('/user/', UserView),
                 web.get('/sticker/{object_id:\d+}', StickerView), web.patch('/sticker/{object_id:\d+}', StickerView),
-                web.delete('/sticker/{object_id:\d+}', StickerView), web.post('/sticker/', StickerView), ])
+                web.delete('/sticker/{object_id:\d+}', StickerView), web.post('/sticker/', StickerView),
+                web.get('/sticker/', StickerView), web.post('/sticker/batch', StickerBatchView),
+                web.patch('/sticker/batch', StickerBatchView), web.delete('/sticker/batch', StickerBatchView),
+                web.get('/metrics', metrics), ])
 
 if __name__ == '__main__':
     web.run_app(app)
@@ -0,0 +1,41 @@
+from functools import cache
+from typing import Type
+
+import pydantic
+from pydantic_core import SchemaValidator
+
+
+class SchemaAdapter:
+    """
+    Валидатор схемы, собранный один раз на модель.
+    Данные проверяются сразу в dict из переданных полей (как model_dump(exclude_unset=True)),
+    экземпляр модели не создается. Для моделей с валидаторами уровня модели - TypeAdapter и model_dump
+    """
+
+    def __init__(self, model: Type[pydantic.BaseModel]):
+        core_schema = model.__pydantic_core_schema__
+        if core_schema['type'] == 'model' and core_schema['schema']['type'] == 'model-fields':
+            self._fields_validator = SchemaValidator(core_schema['schema'], core_schema.get('config'))
+            self._adapter = None
+        else:
+            self._fields_validator = None
+            self._adapter = pydantic.TypeAdapter(model)
+
+    def _to_dict(self, result) -> dict:
+        if self._adapter is not None:
+            return result.model_dump(exclude_unset=True)
+        fields, _, fields_set = result
+        return {key: value for key, value in fields.items() if key in fields_set}
+
+    def validate_python(self, data) -> dict:
+        validator = self._fields_validator or self._adapter
+        return self._to_dict(validator.validate_python(data))
+
+    def validate_json(self, data: bytes) -> dict:
+        validator = self._fields_validator or self._adapter
+        return self._to_dict(validator.validate_json(data))
+
+
+@cache
+def get_adapter(model: Type[pydantic.BaseModel]) -> SchemaAdapter:
+    return SchemaAdapter(model)
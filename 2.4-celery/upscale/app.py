@@ -1,12 +1,14 @@
 from os import getenv
 
 import nanoid
+from celery import states
 from dotenv import load_dotenv
 from flask import Flask, jsonify, request
 from flask.views import MethodView
 from flask_pymongo import PyMongo
 
-from celery_app import celery_app, get_task, upscale_photo
+from celery_app import celery_app, get_task, upscale_batch, upscale_photo
+from result_cache import ResultCache, content_hash
 
 load_dotenv()
 
@@ -15,6 +17,7 @@ MONGO_DSN = getenv("MONGO_DSN")
 app = Flask("app")
 
 mongo = PyMongo(app, uri=MONGO_DSN)
+result_cache = ResultCache(mongo.db)
 celery_app.conf.update(app.config)
 
 
@@ -38,18 +41,53 @@ class Upscale(MethodView):
         return jsonify({"status": task.status, "result": task.result})
 
     def post(self):
-        image_id = self.save_image("image")
+        image_id, result = self.save_image(request.files.get("image"))
+        if result is not None:
+            # это изображение уже обрабатывалось - результат сразу, без задачи
+            return jsonify({"task_id": None, "status": states.SUCCESS, "result": result})
         task = upscale_photo.delay(image_id)
         return jsonify({"task_id": task.id})
 
-    def save_image(self, field) -> str:
-        image = request.files.get(field)
-        return str(mongo.save_file(f"{nanoid.generate()}{image.filename}", image))
+    def save_image(self, image) -> tuple:
+        """
+        :return: (id сохраненного изображения, None) или (None, имя готового файла), если результат есть в кэше
+        """
+        digest = content_hash(image.stream)
+        result = result_cache.get(digest)
+        if result is not None:
+            return None, result
+        return str(mongo.save_file(f"{nanoid.generate()}{image.filename}", image, content_hash=digest)), None
+
+
+class UpscaleBatch(Upscale):
+    def get(self, task_id, image_id):
+        # статус одного изображения пачки: его результат есть в meta задачи сразу после обработки
+        task = get_task(task_id)
+        images = task.info.get("images", {}) if isinstance(task.info, dict) else {}
+        if image_id in images:
+            return jsonify(images[image_id])
+        status = states.PENDING if task.status == "PROGRESS" else task.status
+        return jsonify({"status": status, "result": None})
+
+    def post(self):
+        images = request.files.getlist("images")
+        if not images:
+            return jsonify({"error": "Не переданы файлы images"}), 400
+        saved = [self.save_image(image) for image in images]
+        image_ids = [image_id for image_id, _ in saved if image_id is not None]
+        task = upscale_batch.delay(image_ids) if image_ids else None
+        return jsonify({"task_id": task.id if task else None,
+                        "images": [{"image_id": image_id, "filename": image.filename,
+                                    **({"status": states.SUCCESS, "result": result} if result is not None else {})}
+                                   for (image_id, result), image in zip(saved, images)]})
 
 
 upscale_view = Upscale.as_view("upscale")
+upscale_batch_view = UpscaleBatch.as_view("upscale_batch")
 file_view = File.as_view("file")
 
 app.add_url_rule("/upscale/", view_func=upscale_view, methods=["POST"])
+app.add_url_rule("/upscale/batch", view_func=upscale_batch_view, methods=["POST"])
 app.add_url_rule("/tasks/<string:task_id>", view_func=upscale_view, methods=["GET"])
+app.add_url_rule("/tasks/<string:task_id>/<string:image_id>", view_func=upscale_batch_view, methods=["GET"])
 app.add_url_rule("/processed/<string:file>", view_func=file_view, methods=["GET"])
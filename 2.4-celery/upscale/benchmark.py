@@ -0,0 +1,66 @@
+import argparse
+import multiprocessing
+import resource
+import time
+
+import cv2
+import numpy
+
+from upscale import Scaler, upsample, UPSCALE_TILE_OVERLAP
+
+
+class ResizeScaler:
+    """
+    Замена EDSR через cv2.resize: проверка тайлинга и его накладных расходов без модели
+    """
+
+    def __init__(self):
+        self.scale = 2
+        self.scaler = self
+
+    def upsample(self, image):
+        return cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_CUBIC)
+
+
+def make_image(source: str, megapixels: float) -> numpy.ndarray:
+    image = cv2.imread(source, cv2.IMREAD_COLOR)
+    factor = (megapixels * 1_000_000 / (image.shape[0] * image.shape[1])) ** 0.5
+    return cv2.resize(image, None, fx=factor, fy=factor, interpolation=cv2.INTER_CUBIC)
+
+
+def run(model: str, source: str, megapixels: float, tile_size: int, overlap: int, queue):
+    # отдельный процесс на каждый замер: ru_maxrss не сбрасывается
+    scaler = ResizeScaler() if model == 'resize' else Scaler(model_path=model)
+    image = make_image(source, megapixels)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    result = upsample(scaler, image, tile_size, overlap)
+    duration = time.perf_counter() - start
+    queue.put((image.shape, result.shape, duration, before, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def bench(model: str, source: str, megapixels: list, tile_size: int, overlap: int):
+    context = multiprocessing.get_context('spawn')
+    for size in megapixels:
+        for title, tile in (('whole', 0), (f'tile={tile_size}', tile_size)):
+            queue = context.Queue()
+            process = context.Process(target=run, args=(model, source, size, tile, overlap, queue))
+            process.start()
+            process.join()
+            if process.exitcode:
+                print(f'{size:>4}MP {title:<10} exitcode={process.exitcode}')
+                continue
+            shape, result_shape, duration, before, peak = queue.get()
+            print(f'{size:>4}MP {title:<10} {shape[1]}x{shape[0]} -> {result_shape[1]}x{result_shape[0]} '
+                  f'duration={duration:.2f}s peak_rss={peak / 1024:.0f}MB upsample_rss={(peak - before) / 1024:.0f}MB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='EDSR_x2.pb', help='resize - без модели, cv2.resize вместо EDSR')
+    parser.add_argument('--image', default='lama_300px.png')
+    parser.add_argument('--megapixels', type=float, nargs='*', default=[0.5, 2, 8])
+    parser.add_argument('--tile-size', type=int, default=256)
+    parser.add_argument('--overlap', type=int, default=UPSCALE_TILE_OVERLAP)
+    args = parser.parse_args()
+    bench(args.model, args.image, args.megapixels, args.tile_size, args.overlap)
@@ -12,7 +12,8 @@ from celery.result import AsyncResult
 from dotenv import load_dotenv
 from gridfs import GridFS
 
-from upscale import upscale
+from result_cache import ResultCache
+from upscale import memory_usage, upscale
 
 load_dotenv()
 PG_DSN = getenv("PG_DSN")
@@ -27,30 +28,77 @@ def get_task(task_id: str) -> AsyncResult:
 
 
 @cached({})
-def get_fs():
+def get_db():
     mongo = pymongo.MongoClient(MONGO_DSN)
-    return GridFS(mongo["files"])
+    return mongo["files"]
+
+
+@cached({})
+def get_fs():
+    return GridFS(get_db())
+
+
+@cached({})
+def get_cache():
+    return ResultCache(get_db())
+
+
+def upscale_image(files: GridFS, image_id: str, name: str) -> str:
+    input_image = files.get(ObjectId(image_id))
+    kwargs = {}
+    if hasattr(input_image, 'content_type'):
+        kwargs.update({'content_type': input_image.content_type})
+    if hasattr(input_image, 'filename'):
+        file_extension = splitext(input_image.filename)[1]
+    else:
+        file_extension = ''
+    # sha256 исходного изображения записывает app при загрузке
+    digest = getattr(input_image, 'content_hash', None)
+    if digest is not None:
+        kwargs.update({'content_hash': digest})
+    output_image = files.new_file(filename=f"{nanoid.generate(size=24)}{file_extension}", **kwargs)
+    try:
+        with memory_usage(name):
+            filename = upscale(input_image, output_image)
+    finally:
+        files.delete(ObjectId(image_id))
+    if digest is not None:
+        filename = get_cache().set(digest, filename, output_image.length)
+    return filename
+
+
+def failure_meta(ex: Exception) -> dict:
+    return {'exc_type': type(ex).__name__, 'exc_message': traceback.format_exc().split('\n'), }
 
 
 @celery_app.task(name='upscale_photo', bind=True)
 def upscale_photo(self, image_id):
+    try:
+        return upscale_image(get_fs(), image_id, self.request.id)
+    except Exception as ex:
+        self.update_state(state=states.FAILURE, meta=failure_meta(ex))
+        raise Ignore()
+
+
+@celery_app.task(name='upscale_batch', bind=True)
+def upscale_batch(self, image_ids: list):
+    """
+    Апскейл нескольких изображений за один вызов: один запрос к брокеру и одна запись результата на всю пачку,
+    модель загружается один раз на процесс воркера (Scaler - singleton).
+    Результат каждого изображения попадает в meta задачи сразу после обработки - его можно опрашивать по image_id
+    """
     try:
         files = get_fs()
-        input_image = files.get(ObjectId(image_id))
-        kwargs = {}
-        if hasattr(input_image, 'content_type'):
-            kwargs.update({'content_type': input_image.content_type})
-        if hasattr(input_image, 'filename'):
-            file_extension = splitext(input_image.filename)[1]
-        else:
-            file_extension = ''
-        kwargs.update({'md5': str(input_image._id)})
-        output_image = files.new_file(filename=f"{nanoid.generate(size=24)}{file_extension}", **kwargs)
-        try:
-            return upscale(input_image, output_image)
-        finally:
-            files.delete(ObjectId(image_id))
+        images = {}
+        for image_id in image_ids:
+            try:
+                images[image_id] = {'status': states.SUCCESS,
+                                    'result': upscale_image(files, image_id, f'{self.request.id}:{image_id}')}
+            except Exception as ex:
+                images[image_id] = {'status': states.FAILURE, **failure_meta(ex)}
+            if len(images) < len(image_ids):
+                self.update_state(state='PROGRESS', meta={'images': images})
+        return {'images': images}
     except Exception as ex:
-        self.update_state(state=states.FAILURE,
-                          meta={'exc_type': type(ex).__name__, 'exc_message': traceback.format_exc().split('\n'), })
+        self.update_state(state=states.FAILURE, meta=failure_meta(ex))
         raise Ignore()
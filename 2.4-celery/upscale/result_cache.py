@@ -0,0 +1,83 @@
+import hashlib
+from datetime import datetime
+from os import getenv
+
+from gridfs import GridFS
+from pymongo import ASCENDING
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
+
+# индекс sha256 исходного изображения -> файл результата; вытесняются давно не запрошенные результаты
+UPSCALE_CACHE_COLLECTION = 'upscale_cache'
+UPSCALE_CACHE_MAX_BYTES = int(getenv('UPSCALE_CACHE_MAX_BYTES', 1024 ** 3))
+UPSCALE_CACHE_MAX_FILES = int(getenv('UPSCALE_CACHE_MAX_FILES', 0))  # 0 - без ограничения количества
+
+
+def content_hash(stream, chunk_size: int = 2 ** 20) -> str:
+    # хеш содержимого потоком, позиция потока возвращается в начало
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Кэш результатов апскейла по содержимому. Записи: _id - хеш, filename и length файла результата в GridFS,
+    used_at - время последнего обращения для вытеснения LRU
+    """
+
+    def __init__(self, db: Database, max_bytes: int = UPSCALE_CACHE_MAX_BYTES, max_files: int = UPSCALE_CACHE_MAX_FILES):
+        self.collection = db[UPSCALE_CACHE_COLLECTION]
+        self.indexed = False
+        self.files = GridFS(db)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+
+    def get(self, digest: str):
+        entry = self.collection.find_one_and_update({'_id': digest}, {'$set': {'used_at': datetime.now()}})
+        if entry is None:
+            return None
+        if not self.files.exists(filename=entry['filename']):
+            # файл удален в обход кэша
+            self.collection.delete_one({'_id': digest})
+            return None
+        return entry['filename']
+
+    def set(self, digest: str, filename: str, length: int) -> str:
+        """
+        :return: имя файла результата для этого хеша. Если то же изображение уже обработала другая задача,
+        возвращается прежний результат, а новый файл удаляется
+        """
+        try:
+            self.collection.insert_one({'_id': digest, 'filename': filename, 'length': length,
+                                        'used_at': datetime.now()})
+        except DuplicateKeyError:
+            existing = self.get(digest)
+            if existing is not None and existing != filename:
+                self.delete_file(filename)
+                return existing
+            self.collection.replace_one({'_id': digest}, {'filename': filename, 'length': length,
+                                                          'used_at': datetime.now()}, upsert=True)
+        self.evict()
+        return filename
+
+    def evict(self):
+        if not self.indexed:
+            self.collection.create_index([('used_at', ASCENDING)])
+            self.indexed = True
+        total = next(self.collection.aggregate([{'$group': {'_id': None, 'bytes': {'$sum': '$length'},
+                                                            'files': {'$sum': 1}}}]), {'bytes': 0, 'files': 0})
+        size, count = total['bytes'], total['files']
+        for entry in self.collection.find({}, {'filename': 1, 'length': 1}).sort('used_at', ASCENDING):
+            if size <= self.max_bytes and (not self.max_files or count <= self.max_files):
+                break
+            self.collection.delete_one({'_id': entry['_id']})
+            self.delete_file(entry['filename'])
+            size -= entry['length']
+            count -= 1
+
+    def delete_file(self, filename: str):
+        for grid_file in self.files.find({'filename': filename}):
+            self.files.delete(grid_file._id)
@@ -1,3 +1,8 @@
+import logging
+import resource
+import tracemalloc
+from contextlib import contextmanager
+from os import getenv
 from os.path import splitext
 
 import cv2
@@ -6,30 +11,140 @@ from cv2 import dnn_superres
 from gridfs import GridIn, GridOut
 from singleton_decorator import singleton
 
+# размер стороны тайла в пикселях исходного изображения, 0 - апскейл целиком; перекрытие соседних тайлов
+UPSCALE_TILE_SIZE = int(getenv('UPSCALE_TILE_SIZE', 0))
+UPSCALE_TILE_OVERLAP = int(getenv('UPSCALE_TILE_OVERLAP', 16))
+# 1 - логировать пиковый объем выделенной памяти на задачу (tracemalloc)
+UPSCALE_TRACE_MEMORY = getenv('UPSCALE_TRACE_MEMORY', '0') == '1'
+
+logger = logging.getLogger('upscale')
+
 
 @singleton
 class Scaler:
     def __init__(self, model_path):
+        self.scale = 2
         self.scaler = dnn_superres.DnnSuperResImpl_create()
         self.scaler.readModel(model_path)
-        self.scaler.setModel("edsr", 2)
+        self.scaler.setModel("edsr", self.scale)
+
+
+def tile_positions(length: int, tile_size: int, overlap: int) -> list:
+    # начала тайлов с шагом tile_size - overlap; последний тайл может быть уже, но шире перекрытия
+    return list(range(0, max(length - overlap, 1), tile_size - overlap))
+
+
+def blend(target: numpy.ndarray, tile: numpy.ndarray, weights: numpy.ndarray):
+    # вес нового тайла растет от 0 у края перекрытия до 1
+    if tile.ndim == 3:
+        weights = weights[..., None]
+    target[...] = numpy.rint(tile * weights + target * (1 - weights))
+
 
+def upsample_tiled(scaler, image: numpy.ndarray, scale: int, tile_size: int, overlap: int) -> numpy.ndarray:
+    """
+    Апскейл по перекрывающимся тайлам: память сети зависит от размера тайла, а не всего изображения.
+    Полосы перекрытия с уже записанными тайлами слева и сверху смешиваются, остальное копируется как есть
+    """
+    if not 0 <= overlap < tile_size:
+        raise ValueError('Перекрытие должно быть меньше размера тайла')
+    height, width = image.shape[:2]
+    result = numpy.empty((height * scale, width * scale) + image.shape[2:], dtype=image.dtype)
+    ramp = (numpy.arange(overlap * scale, dtype=numpy.float32) + 0.5) / max(1, overlap * scale)
+    for y in tile_positions(height, tile_size, overlap):
+        for x in tile_positions(width, tile_size, overlap):
+            tile = scaler.upsample(numpy.ascontiguousarray(image[y:y + tile_size, x:x + tile_size]))
+            tile_height, tile_width = tile.shape[:2]
+            target = result[y * scale:y * scale + tile_height, x * scale:x * scale + tile_width]
+            top = len(ramp) if y > 0 else 0
+            left = len(ramp) if x > 0 else 0
+            target[top:, left:] = tile[top:, left:]
+            if top:
+                weights_x = numpy.ones(tile_width, dtype=numpy.float32)
+                weights_x[:left] = ramp[:left]
+                blend(target[:top], tile[:top], numpy.outer(ramp, weights_x))
+            if left:
+                blend(target[top:, :left], tile[top:, :left], numpy.broadcast_to(ramp, (tile_height - top, left)))
+    return result
+
+
+def upsample(scaler: Scaler, image: numpy.ndarray, tile_size: int = UPSCALE_TILE_SIZE,
+             overlap: int = UPSCALE_TILE_OVERLAP) -> numpy.ndarray:
+    if tile_size <= 0 or max(image.shape[:2]) <= tile_size:
+        return scaler.scaler.upsample(image)
+    return upsample_tiled(scaler.scaler, image, scaler.scale, tile_size, overlap)
 
-def upscale(input_image: GridOut, upscale_image: GridIn) -> str:
+
+class BufferReader:
+    """
+    Файловый объект поверх буфера: GridIn читает из него по chunk_size, копируется только текущий чанк
+    """
+
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast('B')
+        self.position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self.view) if size < 0 else self.position + size
+        data = bytes(self.view[self.position:end])
+        self.position += len(data)
+        return data
+
+
+def read_grid_file(grid_file: GridOut) -> numpy.ndarray:
+    # чанки копируются в заранее выделенный буфер, read() держал бы в памяти все чанки и их склейку
+    buffer = numpy.empty(grid_file.length, dtype=numpy.uint8)
+    position = 0
+    while position < grid_file.length:
+        chunk = grid_file.readchunk()
+        buffer[position:position + len(chunk)] = numpy.frombuffer(chunk, dtype=numpy.uint8)
+        position += len(chunk)
+    return buffer
+
+
+@contextmanager
+def memory_usage(name: str, enabled: bool = UPSCALE_TRACE_MEMORY):
+    """
+    Пик памяти, выделенной Python и numpy внутри блока, и max RSS процесса.
+    Память, которую OpenCV выделяет внутри сети, tracemalloc не видит
+    """
+    if not enabled:
+        yield
+        return
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        peak = tracemalloc.get_traced_memory()[1]
+        if started:
+            tracemalloc.stop()
+        logger.info('task=%s peak_allocated_mb=%.1f max_rss_mb=%.0f', name, peak / 2 ** 20,
+                    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+
+def upscale(input_image: GridOut, upscale_image: GridIn, tile_size: int = UPSCALE_TILE_SIZE,
+            overlap: int = UPSCALE_TILE_OVERLAP) -> str:
     """
     :param input_image: изображение для апскейла
     :param upscale_image: файл для сохранения изображения
+    :param tile_size: размер тайла, 0 - апскейл целиком
+    :param overlap: перекрытие тайлов
     :return:
     """
-    scaler = Scaler(model_path='EDSR_x2.pb').scaler
+    scaler = Scaler(model_path='EDSR_x2.pb')
 
     try:
-        image_as_np = numpy.frombuffer(input_image.read(), dtype=numpy.uint8)
+        image_as_np = read_grid_file(input_image)
     finally:
         input_image.close()
     image = cv2.imdecode(image_as_np, cv2.IMREAD_COLOR)
-
-    result_image = scaler.upsample(image)
+    # сжатые данные и исходное изображение больше не нужны - не держать их во время апскейла и кодирования
+    del image_as_np
+    result_image = upsample(scaler, image, tile_size, overlap)
+    del image
 
     file_extension = '.'
     if hasattr(input_image, 'content_type'):
@@ -42,10 +157,11 @@ def upscale(input_image: GridOut, upscale_image: GridIn) -> str:
     if len(file_extension) == 1:
         file_extension = '.jpeg'
 
-    image_as_bytes = cv2.imencode(file_extension, result_image)[1].tobytes()
+    encoded = cv2.imencode(file_extension, result_image)[1]
+    del result_image
 
     try:
-        upscale_image.write(image_as_bytes)
+        upscale_image.write(BufferReader(encoded))
         return upscale_image.filename
     finally:
         upscale_image.close()